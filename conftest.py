@@ -0,0 +1,10 @@
+import pytest
+from django.core.cache import cache
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Файл кэша у прогона свой (yatube.test_settings), но между тестами
+    # он сохраняется: версии лент и страницы прошлого теста не должны
+    # попасть в этот.
+    cache.clear()
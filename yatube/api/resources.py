@@ -0,0 +1,109 @@
+from django.urls import reverse
+
+from posts.counters import user_stats
+
+
+class Field:
+    """
+    Поле ответа API: какие колонки оно читает и как получает значение.
+
+    paths — аргументы only(); пути через «__» подтягивают связанную
+    модель тем же запросом (select_related).
+    """
+    def __init__(self, paths, get):
+        self.paths = tuple(paths)
+        self.get = get
+
+
+def _isoformat(name):
+    return lambda obj: getattr(obj, name).isoformat()
+
+
+def _attr(name):
+    return lambda obj: getattr(obj, name)
+
+
+POST_FIELDS = {
+    'id': Field(['id'], _attr('pk')),
+    'text': Field(['text'], _attr('text')),
+    'pub_date': Field(['pub_date'], _isoformat('pub_date')),
+    'author': Field(['author__username'],
+                    lambda post: post.author.username),
+    'group': Field(['group__slug'],
+                   lambda post: post.group.slug if post.group else None),
+    'image': Field(['image'],
+                   lambda post: post.image.url if post.image else None),
+    'comment_count': Field(['comment_count'], _attr('comment_count')),
+    'url': Field(['author__username'],
+                 lambda post: reverse('post', args=[post.author.username,
+                                                    post.pk])),
+}
+
+COMMENT_FIELDS = {
+    'id': Field(['id'], _attr('pk')),
+    'post': Field(['post_id'], _attr('post_id')),
+    'author': Field(['author__username'],
+                    lambda comment: comment.author.username),
+    'text': Field(['text'], _attr('text')),
+    'created': Field(['created'], _isoformat('created')),
+}
+
+GROUP_FIELDS = {
+    'slug': Field(['slug'], _attr('slug')),
+    'title': Field(['title'], _attr('title')),
+    'description': Field(['description'], _attr('description')),
+    'post_count': Field(['post_count'], _attr('post_count')),
+    'url': Field(['slug'], lambda group: reverse('slug', args=[group.slug])),
+}
+
+PROFILE_FIELDS = {
+    'username': Field(['username'], _attr('username')),
+    'full_name': Field(['first_name', 'last_name'],
+                       lambda user: user.get_full_name()),
+    'post_count': Field(['stats__post_count'],
+                        lambda user: user_stats(user).post_count),
+    'follower_count': Field(['stats__follower_count'],
+                            lambda user: user_stats(user).follower_count),
+    'following_count': Field(['stats__following_count'],
+                             lambda user: user_stats(user).following_count),
+    'url': Field(['username'],
+                 lambda user: reverse('profile', args=[user.username])),
+}
+
+
+class UnknownFields(ValueError):
+    pass
+
+
+def selected_fields(request, fields):
+    """Поля из ?fields=a,b; без параметра — все поля ресурса."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(fields)
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise UnknownFields(
+            'Неизвестные поля: {}. Доступны: {}.'.format(
+                ', '.join(unknown), ', '.join(fields)))
+    return names
+
+
+def project(queryset, fields, names, always=()):
+    """
+    Запрос, читающий только колонки выбранных полей.
+
+    Связанные модели (автор, сообщество, счётчики) подтягиваются
+    JOIN'ом в том же запросе, поэтому страница любого размера — это
+    один SELECT. always — колонки, нужные помимо полей, например ключ
+    курсора.
+    """
+    paths = set(always)
+    for name in names:
+        paths.update(fields[name].paths)
+    related = {path.rsplit('__', 1)[0] for path in paths if '__' in path}
+    return queryset.select_related(*related).only(*paths)
+
+
+def serialize(obj, fields, names):
+    return {name: fields[name].get(obj) for name in names}
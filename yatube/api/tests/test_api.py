@@ -0,0 +1,145 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+@override_settings(API_PAGE_SIZE=2)
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='writer',
+                                              first_name='Лев',
+                                              last_name='Толстой')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Море', slug='sea')
+        cls.posts = [Post.objects.create(text=f'Пост {i}', author=cls.author,
+                                         group=cls.group if i % 2 else None)
+                     for i in range(5)]
+        cls.other = Post.objects.create(text='Чужой', author=cls.reader)
+        for i in range(3):
+            Comment.objects.create(post=cls.posts[0], author=cls.reader,
+                                   text=f'Комментарий {i}')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def walk(self, url, **params):
+        """Все записи по ссылкам next, начиная с первой страницы."""
+        results = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            results.extend(data['results'])
+            if data['next'] is None:
+                return results
+            response = self.client.get(data['next'])
+
+    def test_posts_are_paginated_by_cursor(self):
+        results = self.walk(reverse('api:posts'))
+        expected = [self.other, *reversed(self.posts)]
+        self.assertEqual([item['id'] for item in results],
+                         [post.pk for post in expected])
+        self.assertEqual(results[1], {
+            'id': self.posts[4].pk,
+            'text': 'Пост 4',
+            'pub_date': self.posts[4].pub_date.isoformat(),
+            'author': 'writer',
+            'group': None,
+            'image': None,
+            'comment_count': 0,
+            'url': reverse('post', args=['writer', self.posts[4].pk]),
+        })
+
+    def test_filters(self):
+        results = self.walk(reverse('api:posts'), group='sea',
+                            author='writer')
+        self.assertEqual([item['id'] for item in results],
+                         [self.posts[3].pk, self.posts[1].pk])
+        response = self.client.get(reverse('api:posts'), {'group': 'нет'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Не найдено.'})
+
+    def test_fields_select_only_needed_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('api:posts'),
+                                       {'fields': 'id,author'})
+        self.assertEqual(response.json()['results'][0],
+                         {'id': self.other.pk, 'author': 'reader'})
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]['sql']
+        self.assertIn('"auth_user"."username"', sql)
+        self.assertNotIn('"posts_post"."text"', sql)
+        self.assertNotIn('"auth_user"."password"', sql)
+
+        response = self.client.get(reverse('api:posts'),
+                                   {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['error'])
+
+    def test_comments_load_authors_in_one_query(self):
+        url = reverse('api:comments', args=[self.posts[0].pk])
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'limit': 10})
+        results = response.json()['results']
+        self.assertEqual([item['text'] for item in results],
+                         [f'Комментарий {i}' for i in range(3)])
+        self.assertEqual({item['author'] for item in results}, {'reader'})
+
+    def test_details(self):
+        response = self.client.get(reverse('api:profile', args=['writer']),
+                                   {'fields': 'full_name,post_count'})
+        self.assertEqual(response.json(),
+                         {'full_name': 'Лев Толстой', 'post_count': 5})
+        response = self.client.get(reverse('api:group', args=['sea']))
+        self.assertEqual(response.json()['post_count'], 2)
+        response = self.client.get(reverse('api:post',
+                                           args=[self.posts[0].pk]),
+                                   {'fields': 'comment_count'})
+        self.assertEqual(response.json(), {'comment_count': 3})
+        response = self.client.get(reverse('api:groups'))
+        self.assertEqual([item['slug'] for item in response.json()['results']],
+                         ['sea'])
+
+    def test_etags(self):
+        url = reverse('api:comments', args=[self.posts[0].pk])
+        response = self.client.get(url)
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        Comment.objects.create(post=self.posts[0], author=self.author,
+                               text='Новый')
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 200)
+
+    def test_post_follows_author_and_group_changes(self):
+        post = self.posts[1]
+        url = reverse('api:post', args=[post.pk])
+        self.assertEqual(self.client.get(url).json()['group'], 'sea')
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'ocean'
+        group.save()
+        author = User.objects.get(pk=self.author.pk)
+        author.username = 'tolstoy'
+        author.save()
+        data = self.client.get(url).json()
+        self.assertEqual((data['group'], data['author']), ('ocean', 'tolstoy'))
+
+    def test_follow_feed(self):
+        url = reverse('api:follow')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.reader)
+        results = self.walk(url, fields='id')
+        self.assertEqual([item['id'] for item in results],
+                         [post.pk for post in reversed(self.posts)])
+        response = self.client.get(url)
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
@@ -0,0 +1,182 @@
+import functools
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
+
+from posts.cache import conditional, feed_cache_key
+from posts.models import Comment, Group, Post
+from posts.paginators import CursorPaginator
+from posts.timeline import timeline_posts
+
+from .resources import (COMMENT_FIELDS, GROUP_FIELDS, POST_FIELDS,
+                        PROFILE_FIELDS, UnknownFields, project,
+                        selected_fields, serialize)
+
+JSON_PARAMS = {'ensure_ascii': False}
+
+
+def api_view(view):
+    """Только GET/HEAD, ошибки — в JSON с подходящим статусом."""
+    @require_safe
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except UnknownFields as error:
+            return error_response(str(error), 400)
+        except Http404:
+            return error_response('Не найдено.', 404)
+    return wrapper
+
+
+def error_response(message, status):
+    return JsonResponse({'error': message}, status=status,
+                        json_dumps_params=JSON_PARAMS)
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+    except ValueError:
+        return settings.API_PAGE_SIZE
+    return max(1, min(size, settings.API_MAX_PAGE_SIZE))
+
+
+def page_url(request, cursor_param, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params.pop('after', None)
+    params.pop('before', None)
+    params[cursor_param] = cursor
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+
+def paginated(request, queryset, fields, ordering):
+    """
+    Страница ресурса по курсору: {"results", "next", "previous"}.
+
+    Ключ курсора читается всегда, остальные колонки — только для
+    запрошенных полей.
+    """
+    names = selected_fields(request, fields)
+    key_fields = [field.lstrip('-') for field in ordering]
+    queryset = project(queryset, fields, names,
+                       always=key_fields).order_by(*ordering)
+    paginator = CursorPaginator(queryset, page_size(request), ordering)
+    page = paginator.get_page(after=request.GET.get('after'),
+                              before=request.GET.get('before'))
+    return {
+        'results': [serialize(obj, fields, names) for obj in page],
+        'next': page_url(request, 'after', page.next_cursor),
+        'previous': page_url(request, 'before', page.previous_cursor),
+    }
+
+
+def cached_json(request, names, build):
+    """
+    JSON, зависящий от лент names: ETag и 304 по версиям лент.
+
+    Ключ включает путь и все параметры запроса (поля, фильтры,
+    курсор), поэтому разные выборки не путаются ни в ETag, ни в кэше
+    страниц.
+    """
+    feed_key = '&'.join([feed_cache_key(request, *names), request.path,
+                         request.GET.urlencode()])
+    return conditional(
+        request, feed_key, names,
+        lambda: JsonResponse(build(), json_dumps_params=JSON_PARAMS))
+
+
+@api_view
+def post_list(request):
+    """Посты, новые сначала; ?group=<slug> и ?author=<username>."""
+    posts = Post.objects.all()
+    names = []
+    if request.GET.get('group'):
+        group = get_object_or_404(Group, slug=request.GET['group'])
+        posts = posts.filter(group=group)
+        names.append(f'group:{group.pk}')
+    if request.GET.get('author'):
+        author = get_object_or_404(User, username=request.GET['author'])
+        posts = posts.filter(author=author)
+        names.append(f'profile:{author.pk}')
+    return cached_json(
+        request, names or ['index'],
+        lambda: paginated(request, posts, POST_FIELDS, ('-pub_date', '-id')))
+
+
+@api_view
+def post_detail(request, post_id):
+    names = selected_fields(request, POST_FIELDS)
+    post = get_object_or_404(project(Post.objects, POST_FIELDS, names),
+                             pk=post_id)
+    return cached_json(request, [f'post:{post.pk}'],
+                       lambda: serialize(post, POST_FIELDS, names))
+
+
+@api_view
+def comment_list(request, post_id):
+    """Комментарии к посту в порядке написания."""
+    post = get_object_or_404(Post.objects.only('id'), pk=post_id)
+    comments = Comment.objects.filter(post=post)
+    return cached_json(
+        request, [f'post:{post.pk}'],
+        lambda: paginated(request, comments, COMMENT_FIELDS,
+                          ('created', 'id')))
+
+
+@api_view
+def group_list(request):
+    # Сообщества создаются, меняются и удаляются вместе со сбросом
+    # главной ленты, как и их счётчики постов.
+    return cached_json(
+        request, ['index'],
+        lambda: paginated(request, Group.objects.all(), GROUP_FIELDS,
+                          ('id',)))
+
+
+@api_view
+def group_detail(request, slug):
+    names = selected_fields(request, GROUP_FIELDS)
+    group = get_object_or_404(
+        project(Group.objects, GROUP_FIELDS, names, always=['id']),
+        slug=slug)
+    return cached_json(request, [f'group:{group.pk}'],
+                       lambda: serialize(group, GROUP_FIELDS, names))
+
+
+@api_view
+def profile_detail(request, username):
+    names = selected_fields(request, PROFILE_FIELDS)
+    user = get_object_or_404(
+        project(User.objects, PROFILE_FIELDS, names, always=['id']),
+        username=username)
+    return cached_json(request, [f'profile:{user.pk}'],
+                       lambda: serialize(user, PROFILE_FIELDS, names))
+
+
+@api_view
+def follow_list(request):
+    """
+    Лента подписок текущего пользователя.
+
+    Она своя у каждого читателя и не привязана к версиям лент, поэтому
+    ETag считается по содержимому: клиент экономит трафик, сервер —
+    нет.
+    """
+    if not request.user.is_authenticated:
+        return error_response('Нужно войти.', 401)
+    response = JsonResponse(
+        paginated(request, timeline_posts(request.user), POST_FIELDS,
+                  ('-pub_date', '-id')),
+        json_dumps_params=JSON_PARAMS)
+    response['ETag'] = quote_etag(hashlib.md5(response.content).hexdigest())
+    return get_conditional_response(request, etag=response['ETag'],
+                                    response=response)
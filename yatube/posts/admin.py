@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Comment, Follow, Group, Post
+from .search import search_post_ids
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,6 +10,17 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по полнотекстовому индексу вместо LIKE по всей таблице."""
+        subquery = search_post_ids(search_term)
+        if subquery is None:
+            return queryset, False
+        sql, params = subquery
+        # RawSQL в id__in оборачивается в лишние скобки и превращается
+        # в скалярный подзапрос, поэтому условие добавляется через extra.
+        where = f'{Post._meta.db_table}.id IN ({sql})'
+        return queryset.extra(where=[where], params=params), False
+
 
 admin.site.register(Post, PostAdmin)
 
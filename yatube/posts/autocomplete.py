@@ -0,0 +1,136 @@
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Group, PrefixEntry, User
+
+CACHE_KEY = 'autocomplete:{}:{}'
+# Верхняя граница диапазона: больше любого символа Unicode, поэтому
+# условие key < prefix + KEY_END отсекает всё, что не начинается
+# с prefix.
+KEY_END = '\U0010ffff'
+KEY_LENGTH = PrefixEntry._meta.get_field('key').max_length
+
+
+def normalize(value):
+    """Приводит строку к виду ключа: без регистра, «ё» и лишних пробелов."""
+    value = unicodedata.normalize('NFKC', value).casefold()
+    return ' '.join(value.replace('ё', 'е').split())
+
+
+def user_entries(user):
+    full_name = user.get_full_name()
+    label = f'{user.username} ({full_name})' if full_name else user.username
+    keys = {normalize(user.username)}
+    keys.update(normalize(word) for word in full_name.split())
+    return [PrefixEntry(kind=PrefixEntry.USER, key=key[:KEY_LENGTH],
+                        object_id=user.pk, slug=user.username, label=label)
+            for key in keys if key]
+
+
+def group_entries(group):
+    keys = {normalize(group.title), normalize(group.slug)}
+    keys.update(normalize(word) for word in group.title.split())
+    return [PrefixEntry(kind=PrefixEntry.GROUP, key=key[:KEY_LENGTH],
+                        object_id=group.pk, slug=group.slug,
+                        label=group.title)
+            for key in keys if key]
+
+
+ENTRIES = {
+    PrefixEntry.USER: user_entries,
+    PrefixEntry.GROUP: group_entries,
+}
+
+
+def index(kind, obj):
+    """Пересобирает ключи одного пользователя или сообщества."""
+    with transaction.atomic():
+        remove(kind, obj.pk)
+        PrefixEntry.objects.bulk_create(ENTRIES[kind](obj),
+                                        ignore_conflicts=True)
+
+
+def remove(kind, object_id):
+    PrefixEntry.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def _insert(kind, queryset, batch_size):
+    total = 0
+    batch = []
+    for obj in queryset.iterator(chunk_size=batch_size):
+        batch.extend(ENTRIES[kind](obj))
+        if len(batch) >= batch_size:
+            PrefixEntry.objects.bulk_create(batch, batch_size=500)
+            total += len(batch)
+            batch = []
+    PrefixEntry.objects.bulk_create(batch, batch_size=500)
+    return total + len(batch)
+
+
+def index_many(kind, queryset, batch_size=5000):
+    """
+    Пересобирает ключи всех объектов queryset пачками.
+
+    Нужна после bulk_create, когда новые объекты известны: ключи
+    остальных пользователей и сообществ не трогаются.
+    """
+    with transaction.atomic():
+        PrefixEntry.objects.filter(
+            kind=kind, object_id__in=queryset.values('pk')).delete()
+        return _insert(kind, queryset, batch_size)
+
+
+def rebuild_all(batch_size=5000):
+    """
+    Пересобирает индекс целиком.
+
+    Нужна после массовой загрузки через bulk_create, которая не
+    вызывает сигналы.
+    """
+    total = 0
+    with transaction.atomic():
+        PrefixEntry.objects.all().delete()
+        for kind, queryset in ((PrefixEntry.USER, User.objects.all()),
+                               (PrefixEntry.GROUP, Group.objects.all())):
+            total += _insert(kind, queryset, batch_size)
+    return total
+
+
+def suggest(kind, prefix):
+    """
+    Подсказки по началу строки: список словарей label/slug.
+
+    Один запрос по диапазону ключей [prefix, prefix + KEY_END) с
+    сортировкой по ключу читает из индекса только первые строки,
+    поэтому время ответа не зависит от размера таблицы. Результат
+    ненадолго кэшируется по префиксу.
+    """
+    prefix = normalize(prefix)[:KEY_LENGTH]
+    if not prefix:
+        return []
+    cache_key = CACHE_KEY.format(kind, prefix)
+    results = cache.get(cache_key)
+    if results is not None:
+        return results
+
+    limit = settings.AUTOCOMPLETE_LIMIT
+    # У объекта бывает несколько ключей с одним префиксом, поэтому
+    # строк читается с запасом, а дубликаты отбрасываются.
+    rows = (PrefixEntry.objects
+            .filter(kind=kind, key__gte=prefix, key__lt=prefix + KEY_END)
+            .order_by('key', 'object_id')
+            .values_list('object_id', 'slug', 'label')[:limit * 3])
+    results = []
+    seen = set()
+    for object_id, slug, label in rows:
+        if object_id in seen:
+            continue
+        seen.add(object_id)
+        results.append({'slug': slug, 'label': label})
+        if len(results) == limit:
+            break
+    cache.set(cache_key, results, settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+    return results
@@ -0,0 +1,44 @@
+from django.db import connection
+from django.db.models import DateTimeField
+
+
+class RowWriter:
+    """
+    Пишет кортежи значений в таблицу модели одним executemany.
+
+    Для больших загрузок bulk_create упирается в создание экземпляров
+    моделей и в лимит переменных SQLite на один INSERT, а ещё
+    перезаписывает поля auto_now_add, поэтому строки идут в базу
+    без ORM. С ignore_conflicts строки с уже занятым ключом молча
+    пропускаются: повторная запись той же пачки ничего не ломает.
+    """
+    def __init__(self, model, fields, ignore_conflicts=False):
+        ops = connection.ops
+        fields = [model._meta.get_field(name) for name in fields]
+        self.sql = '{} {} ({}) VALUES ({}) {}'.format(
+            ops.insert_statement(ignore_conflicts=ignore_conflicts),
+            ops.quote_name(model._meta.db_table),
+            ', '.join(ops.quote_name(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+            ops.ignore_conflicts_suffix_sql(ignore_conflicts=ignore_conflicts),
+        ).rstrip()
+        self.dates = [index for index, field in enumerate(fields)
+                      if isinstance(field, DateTimeField)]
+
+    def adapt(self, row):
+        if not self.dates:
+            return row
+        row = list(row)
+        for index in self.dates:
+            row[index] = connection.ops.adapt_datetimefield_value(row[index])
+        return row
+
+    def write(self, rows):
+        """Пишет пачку в текущей транзакции; возвращает число вставок."""
+        batch = [self.adapt(row) for row in rows]
+        if not batch:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.executemany(self.sql, batch)
+            # Пропущенные из-за конфликта строки в rowcount не входят.
+            return cursor.rowcount
@@ -0,0 +1,218 @@
+import hashlib
+import math
+import random
+import sys
+import time
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+FEED_VERSION_KEY = 'feed-version:{}'
+FEED_CHANGED_KEY = 'feed-changed:{}'
+PAGE_PARAMS = ('page', 'after', 'before')
+LOCK_KEY = 'lock:{}'
+
+# Параметры get_or_compute: сколько держать блокировку пересчёта,
+# сколько ждать чужого пересчёта и как рано начинать свой (XFetch).
+LOCK_TIMEOUT = 30
+WAIT_TIMEOUT = 2
+WAIT_STEP = 0.05
+XFETCH_BETA = 1.0
+
+
+def _initial_version():
+    # Версия от текущего времени: если ключ версии вытеснят из кэша,
+    # новая версия всё равно не совпадёт со старыми фрагментами.
+    return int(time.time() * 1000)
+
+
+def feed_versions(*names):
+    """Текущие версии лент; отсутствующие заводятся заново."""
+    keys = {FEED_VERSION_KEY.format(name): name for name in names}
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial_version(), None)
+            versions[key] = cache.get(key)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def feed_changed(*names):
+    """Время последнего изменения лент; неизвестное считается сейчас."""
+    keys = {FEED_CHANGED_KEY.format(name): name for name in names}
+    changed = cache.get_many(keys)
+    for key in keys:
+        if key not in changed:
+            cache.add(key, time.time(), None)
+            changed[key] = cache.get(key)
+    return {keys[key]: value for key, value in changed.items()}
+
+
+def touch(*names):
+    """
+    Отмечает, что страницы лент изменились вне закэшированных фрагментов.
+
+    Так меняются валидаторы страницы (например, счётчики подписчиков
+    в карточке профиля), а фрагменты с постами остаются в кэше.
+    """
+    now = time.time()
+    cache.set_many({FEED_CHANGED_KEY.format(name): now for name in names},
+                   None)
+
+
+def invalidate(*names):
+    """Сбрасывает все закэшированные страницы перечисленных лент."""
+    for name in set(names):
+        key = FEED_VERSION_KEY.format(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), None)
+    touch(*names)
+
+
+def feed_cache_key(request, *names):
+    """
+    Ключ фрагмента ленты: версии лент и страница или курсор.
+
+    От зрителя фрагмент не зависит: ссылка «Редактировать» в карточке
+    поста — метка {% hole %}, её заполняет posts.middleware.
+    """
+    versions = feed_versions(*names)
+    parts = [f'{name}={versions[name]}' for name in names]
+    parts += [f'{param}={request.GET[param]}'
+              for param in PAGE_PARAMS if param in request.GET]
+    return '&'.join(parts)
+
+
+def post_feeds(author_id, group_id, post_id=None):
+    """Ленты, в которых показывается пост, и страница самого поста."""
+    names = ['index', f'profile:{author_id}']
+    if group_id is not None:
+        names.append(f'group:{group_id}')
+    if post_id is not None:
+        names.append(f'post:{post_id}')
+    return names
+
+
+def validators(request, page_tag, changed):
+    """
+    ETag и Last-Modified страницы для текущего зрителя.
+
+    page_tag описывает общее для всех тело страницы, а части для
+    зрителя ({% hole %}) зависят только от того, кто он, поэтому
+    ETag — это page_tag вместе с id пользователя. Last-Modified
+    отдаётся лишь анонимам: дата не учитывает, кто смотрит страницу.
+    """
+    raw = f'{page_tag}&user={request.user.pk}'
+    etag = quote_etag(hashlib.md5(raw.encode()).hexdigest())
+    last_modified = None
+    if not request.user.is_authenticated:
+        last_modified = int(max(changed.values()))
+    return etag, last_modified
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    elif response.has_header('Last-Modified'):
+        del response['Last-Modified']
+
+
+def conditional(request, feed_key, names, build):
+    """
+    Отвечает 304, если у клиента актуальная версия страницы лент names.
+
+    Тело страницы описывается ключом фрагмента (версии лент, страница)
+    и временем изменения лент. Всё это лежит в кэше, поэтому проверка
+    не трогает базу. build() вызывается, только если страницу нужно
+    отдать целиком.
+
+    Ленты с их временем изменения остаются в response.surrogate_keys,
+    а описание тела — в response.page_tag: по ним кэш целых страниц
+    (posts.middleware.PageCacheMiddleware) проверяет свои записи.
+    """
+    changed = feed_changed(*names)
+    raw = '&'.join([feed_key, *(f'{name}@{changed[name]}' for name in names)])
+    page_tag = hashlib.md5(raw.encode()).hexdigest()
+    etag, last_modified = validators(request, page_tag, changed)
+    if request.method in ('GET', 'HEAD'):
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+    # Метки {% hole %} ставятся, только если ответ сошьёт и закэширует
+    # PageCacheMiddleware.
+    request.punch_holes = getattr(request, 'page_cache', False)
+    try:
+        response = build()
+    finally:
+        request.punch_holes = False
+    response.surrogate_keys = changed
+    response.page_tag = page_tag
+    if response.status_code == 200:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def acquire(name, timeout=LOCK_TIMEOUT):
+    """
+    Берёт блокировку name во всех процессах, если она свободна.
+
+    Блокировка — ключ кэша, созданный через add, поэтому достаётся
+    ровно одному претенденту и сама истекает через timeout секунд,
+    если владелец упал.
+    """
+    return cache.add(LOCK_KEY.format(name), 1, timeout)
+
+
+def release(name):
+    cache.delete(LOCK_KEY.format(name))
+
+
+def _should_refresh(delta, expires, beta):
+    # XFetch: чем дольше пересчёт и чем ближе срок, тем вероятнее
+    # обновить значение заранее. Срабатывает у одного из многих.
+    draw = max(random.random(), sys.float_info.min)
+    return time.time() - delta * beta * math.log(draw) >= expires
+
+
+def get_or_compute(key, compute, timeout, beta=XFETCH_BETA):
+    """
+    Значение из кэша или compute(), без лавины пересчётов.
+
+    Значение хранится вместе со временем его вычисления и сроком
+    годности. Незадолго до срока кто-то один начинает пересчёт
+    заранее (probabilistic early expiration), остальные в это время
+    получают прежнее значение. Если значения нет совсем, считает
+    только взявший блокировку; остальные ждут его до WAIT_TIMEOUT
+    секунд и лишь потом считают сами.
+
+    В кэше запись живёт вдвое дольше timeout: второй половиной срока
+    пользуются как устаревшим значением, пока идёт пересчёт.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires = entry
+        if not _should_refresh(delta, expires, beta):
+            return value
+        if not acquire(key):
+            return value
+    elif not acquire(key):
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_STEP)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+        return compute()
+    try:
+        started = time.monotonic()
+        value = compute()
+        delta = time.monotonic() - started
+        cache.set(key, (value, delta, time.time() + timeout), timeout * 2)
+        return value
+    finally:
+        release(key)
@@ -0,0 +1,134 @@
+from django.db.models import (Count, F, IntegerField, OuterRef, Q,
+                              Subquery)
+from django.db.models.functions import Coalesce
+
+from .cache import get_or_compute
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+BATCH_SIZE = 1000
+STATS_KEY = 'user-stats:{}'
+# Сколько секунд пересчитанные счётчики отдаются другим воркерам,
+# которые успели не застать строку UserStats.
+STATS_REPAIR_TIMEOUT = 5
+
+
+def bump(model, pk, **deltas):
+    """Атомарно сдвигает счётчики строки на deltas одним UPDATE."""
+    if pk is None:
+        return
+    model.objects.filter(pk=pk).update(
+        **{field: F(field) + delta for field, delta in deltas.items()})
+
+
+def _count(queryset, field):
+    """Подзапрос COUNT(*) по внешнему ключу field с нулём вместо NULL."""
+    subquery = (queryset.filter(**{field: OuterRef('pk')})
+                .order_by().values(field)
+                .annotate(total=Count('pk')).values('total'))
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), 0)
+
+
+COUNTERS = (
+    (Post, {'comment_count': (Comment.objects.all(), 'post')}),
+    (Group, {'post_count': (Post.objects.all(), 'group')}),
+    (UserStats, {
+        'post_count': (Post.objects.all(), 'author'),
+        'follower_count': (Follow.objects.all(), 'author'),
+        'following_count': (Follow.objects.all(), 'user'),
+    }),
+)
+
+
+def recount(queryset):
+    """Пересчитывает счётчики строк queryset одним UPDATE."""
+    return queryset.update(**{
+        field: _count(counted, fk)
+        for field, (counted, fk) in dict(COUNTERS)[queryset.model].items()})
+
+
+def recount_ids(model, pks):
+    """Пересчитывает счётчики строк pks пачками по BATCH_SIZE."""
+    pks = sorted(pks)
+    for start in range(0, len(pks), BATCH_SIZE):
+        recount(model.objects.filter(pk__in=pks[start:start + BATCH_SIZE]))
+
+
+def recount_all():
+    """Пересчитывает все счётчики с нуля: один UPDATE на таблицу."""
+    for model, _ in COUNTERS:
+        recount(model.objects.all())
+
+
+def user_stats(user):
+    """
+    Счётчики пользователя; недостающая строка создаётся с пересчётом.
+
+    Сигнал user_create_stats пропускает raw-сохранения (loaddata), а
+    сырые INSERT его не вызывают вовсе, поэтому строки может не быть.
+    Живой запрос не должен падать из-за этого и ждать repair_counters.
+    Пересчёт идёт через get_or_compute: когда профиль открывают многие
+    сразу, COUNT по постам и подпискам выполняет только один из них.
+    """
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        pass
+    user.stats = get_or_compute(STATS_KEY.format(user.pk),
+                                lambda: _repair_stats(user.pk),
+                                STATS_REPAIR_TIMEOUT)
+    return user.stats
+
+
+def _repair_stats(user_id):
+    UserStats.objects.get_or_create(user_id=user_id)
+    recount(UserStats.objects.filter(pk=user_id))
+    return UserStats.objects.get(pk=user_id)
+
+
+def create_missing_stats():
+    """Заводит строки UserStats пользователям, у которых их нет."""
+    missing = (User.objects.filter(stats__isnull=True)
+               .values_list('pk', flat=True).iterator())
+    created = 0
+    batch = []
+    for user_id in missing:
+        batch.append(UserStats(user_id=user_id))
+        if len(batch) == BATCH_SIZE:
+            created += len(UserStats.objects.bulk_create(batch))
+            batch = []
+    created += len(UserStats.objects.bulk_create(batch))
+    return created
+
+
+def find_drift(model, counters):
+    """Строки, у которых хоть один счётчик разошёлся с фактом."""
+    rows = model.objects.annotate(**{
+        f'actual_{field}': _count(queryset, fk)
+        for field, (queryset, fk) in counters.items()})
+    condition = Q()
+    for field in counters:
+        condition |= ~Q(**{field: F(f'actual_{field}')})
+    return rows.filter(condition).order_by('pk')
+
+
+def repair(model, counters, dry_run=False):
+    """
+    Сверяет счётчики модели с фактом и чинит расхождения пачками.
+
+    Возвращает число строк с расхождениями.
+    """
+    fixed = 0
+    batch = []
+    for row in find_drift(model, counters).iterator(chunk_size=BATCH_SIZE):
+        fixed += 1
+        if dry_run:
+            continue
+        for field in counters:
+            setattr(row, field, getattr(row, f'actual_{field}'))
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            model.objects.bulk_update(batch, list(counters))
+            batch = []
+    if batch:
+        model.objects.bulk_update(batch, list(counters))
+    return fixed
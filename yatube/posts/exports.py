@@ -0,0 +1,72 @@
+import csv
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Comment, Post
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+CSV_COLUMNS = ('type', 'id', 'created', 'text', 'group', 'image', 'image_path',
+               'post_id')
+
+
+def export_rows(author_id):
+    """
+    Все посты, затем все комментарии автора, по одной строке-словарю.
+
+    Записи читаются через .iterator() порциями EXPORT_CHUNK_SIZE и
+    кортежами values_list, без моделей и без кэша QuerySet: в памяти
+    одновременно только одна порция, сколько бы записей ни было.
+    У поста с картинкой есть путь к файлу в хранилище и его URL.
+    """
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    posts = (Post.objects.filter(author_id=author_id)
+             .order_by('pub_date', 'id')
+             .values_list('id', 'pub_date', 'text', 'group__slug', 'image'))
+    for post_id, pub_date, text, group, image in posts.iterator(chunk_size):
+        yield {
+            'type': 'post', 'id': post_id, 'created': pub_date,
+            'text': text, 'group': group,
+            'image': default_storage.url(image) if image else None,
+            'image_path': image or None,
+        }
+    comments = (Comment.objects.filter(author_id=author_id)
+                .order_by('created', 'id')
+                .values_list('id', 'created', 'text', 'post_id'))
+    for comment_id, created, text, post_id in comments.iterator(chunk_size):
+        yield {
+            'type': 'comment', 'id': comment_id, 'created': created,
+            'text': text, 'post_id': post_id,
+        }
+
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+class _Line:
+    """Файл для csv.writer, который просто возвращает записанное."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        yield writer.writerow([
+            row['created'].isoformat() if key == 'created' else row.get(key)
+            for key in CSV_COLUMNS])
+
+
+def export_lines(author_id, fmt):
+    """Строки выгрузки автора в формате fmt ('ndjson' или 'csv')."""
+    render = ndjson_lines if fmt == 'ndjson' else csv_lines
+    return render(export_rows(author_id))
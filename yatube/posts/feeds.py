@@ -0,0 +1,140 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.syndication.views import Feed
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+
+from .cache import conditional, feed_cache_key
+from .models import Group, Post
+
+
+class PostsFeed(Feed):
+    """
+    Последние посты ленты в RSS 2.0.
+
+    Лента называется так же, как HTML-страница, с которой она снята
+    (index, group:<id>, profile:<id>), поэтому сигналы о новых и
+    изменённых постах сбрасывают её вместе со страницей. Ответ идёт
+    через posts.cache.conditional: сильный ETag, 304 без запросов
+    к базе и запись в кэше целых страниц, так что опрос неизменной
+    ленты читателем почти ничего не стоит.
+    """
+    title = 'Yatube: последние записи'
+    description = 'Новые записи всех авторов Yatube.'
+
+    def __call__(self, request, *args, **kwargs):
+        try:
+            obj = self.get_object(request, *args, **kwargs)
+        except ObjectDoesNotExist:
+            raise Http404('Лента не найдена.')
+        names = self.feed_names(obj)
+        # Путь различает RSS и Atom одной и той же ленты.
+        feed_key = '&'.join([feed_cache_key(request, *names), request.path])
+        return conditional(request, feed_key, names,
+                           lambda: self.render(request, obj))
+
+    def render(self, request, obj):
+        feedgen = self.get_feed(obj, request)
+        response = HttpResponse(content_type=feedgen.content_type)
+        feedgen.write(response, 'utf-8')
+        return response
+
+    def feed_names(self, obj):
+        return ['index']
+
+    def link(self, obj):
+        return reverse('index')
+
+    def posts(self, obj):
+        return Post.objects.all()
+
+    def items(self, obj):
+        # Порядок совпадает с индексами post_*_pub_date: выборка
+        # читает только первые SYNDICATION_ITEMS записей индекса.
+        return (self.posts(obj).select_related('author', 'group')
+                .order_by('-pub_date', '-id')
+                [:settings.SYNDICATION_ITEMS])
+
+    def item_title(self, post):
+        return Truncator(post.text).words(10)
+
+    def item_description(self, post):
+        return post.text
+
+    def item_link(self, post):
+        return reverse('post', args=[post.author.username, post.pk])
+
+    def item_pubdate(self, post):
+        return post.pub_date
+
+    def item_author_name(self, post):
+        return post.author.get_full_name() or post.author.username
+
+    def item_author_link(self, post):
+        return reverse('profile', args=[post.author.username])
+
+    def item_categories(self, post):
+        return [post.group.title] if post.group_id else []
+
+
+class GroupPostsFeed(PostsFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def feed_names(self, group):
+        return [f'group:{group.pk}']
+
+    def title(self, group):
+        return f'Yatube: сообщество {group.title}'
+
+    def description(self, group):
+        return group.description
+
+    def link(self, group):
+        return reverse('slug', args=[group.slug])
+
+    def posts(self, group):
+        return group.group_posts.all()
+
+
+class ProfilePostsFeed(PostsFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def feed_names(self, author):
+        return [f'profile:{author.pk}']
+
+    def title(self, author):
+        return f'Yatube: {author.get_full_name() or author.username}'
+
+    def description(self, author):
+        return f'Новые записи автора {author.username}.'
+
+    def link(self, author):
+        return reverse('profile', args=[author.username])
+
+    def posts(self, author):
+        return author.user_posts.all()
+
+
+class AtomFeedMixin:
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self._get_dynamic_attr('description', obj)
+
+
+class PostsAtomFeed(AtomFeedMixin, PostsFeed):
+    pass
+
+
+class GroupPostsAtomFeed(AtomFeedMixin, GroupPostsFeed):
+    pass
+
+
+class ProfilePostsAtomFeed(AtomFeedMixin, ProfilePostsFeed):
+    pass
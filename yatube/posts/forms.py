@@ -1,6 +1,8 @@
-from django.forms import ModelForm
+from django.core.files.uploadedfile import UploadedFile
+from django.forms import CharField, Form, ModelForm
 
 from .models import Comment, Post
+from .uploads import normalize_image
 
 
 class PostForm(ModelForm):
@@ -11,8 +13,20 @@ class PostForm(ModelForm):
         help_texts = {'text': 'Введите текст',
                       'group': 'Укажите сообщество(необязательно)'}
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return normalize_image(image)
+        return image
+
 
 class CommentForm(ModelForm):
     class Meta:
         model = Comment
         fields = ['text']
+
+
+class SearchForm(Form):
+    q = CharField(label='Запрос', max_length=200, required=False)
+    group = CharField(label='Сообщество', max_length=100, required=False)
+    author = CharField(label='Автор', max_length=150, required=False)
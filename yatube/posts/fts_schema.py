@@ -0,0 +1,62 @@
+"""
+SQL полнотекстового индекса по Post.text для миграций.
+
+Модуль не импортирует модели и не должен меняться задним числом:
+на него ссылаются миграции 0009 и 0011. Таблица FTS5 с внешним
+содержимым хранит только инвертированный индекс, сам текст остаётся
+в posts_post; триггеры держат индекс в актуальном виде.
+"""
+
+TABLE_SQL = """
+    CREATE VIRTUAL TABLE posts_post_fts USING fts5(
+        text,
+        content='posts_post',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+"""
+
+TRIGGERS_SQL = (
+    """
+    CREATE TRIGGER posts_post_fts_insert AFTER INSERT ON posts_post BEGIN
+        INSERT INTO posts_post_fts (rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_post_fts_delete AFTER DELETE ON posts_post BEGIN
+        INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_post_fts_update AFTER UPDATE OF text ON posts_post
+    BEGIN
+        INSERT INTO posts_post_fts (posts_post_fts, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO posts_post_fts (rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+)
+
+REBUILD_SQL = "INSERT INTO posts_post_fts (posts_post_fts) VALUES ('rebuild')"
+
+DROP_TRIGGERS_SQL = (
+    'DROP TRIGGER IF EXISTS posts_post_fts_update',
+    'DROP TRIGGER IF EXISTS posts_post_fts_delete',
+    'DROP TRIGGER IF EXISTS posts_post_fts_insert',
+)
+
+DROP_SQL = (*DROP_TRIGGERS_SQL, 'DROP TABLE IF EXISTS posts_post_fts')
+
+# Для миграций, пересоздающих posts_post: триггеры могли и уцелеть.
+RECREATE_TRIGGERS_SQL = (*DROP_TRIGGERS_SQL, *TRIGGERS_SQL)
+
+
+def run(statements):
+    """Операция RunPython, выполняющая statements только в SQLite."""
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return operation
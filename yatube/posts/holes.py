@@ -0,0 +1,109 @@
+import re
+from urllib.parse import quote, unquote
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpRequest
+from django.template.loader import render_to_string
+
+from .forms import CommentForm
+from .models import Follow
+
+# Метка «дырки» в общем теле страницы: имя и аргументы, экранированные
+# так, что в них нет ни двоеточий, ни конца комментария.
+MARKER = '<!--hole:{}-->'
+MARKER_RE = re.compile(rb'<!--hole:([a-z_]+)((?::[^:>]*)*)-->')
+MARKER_START = b'<!--hole:'
+
+
+def nav(request):
+    return render_to_string('includes/nav.html', request=request)
+
+
+def menu(request, active):
+    return render_to_string('includes/menu.html', {active: True},
+                            request=request)
+
+
+def follow_button(request, username):
+    if not request.user.is_authenticated:
+        return ''
+    following = Follow.objects.filter(
+        user=request.user, author__username=username).exists()
+    return render_to_string('includes/follow_button.html',
+                            {'username': username, 'following': following},
+                            request=request)
+
+
+def edit_link(request, author_id, username, post_id):
+    if str(request.user.pk) != author_id:
+        return ''
+    return render_to_string('includes/edit_link.html',
+                            {'username': username, 'post_id': post_id},
+                            request=request)
+
+
+def comment_form(request, username, post_id):
+    if not request.user.is_authenticated:
+        return ''
+    return render_to_string('includes/comment_form.html',
+                            {'form': CommentForm(), 'username': username,
+                             'post_id': post_id},
+                            request=request)
+
+
+HOLES = {
+    'nav': nav,
+    'menu': menu,
+    'follow_button': follow_button,
+    'edit_link': edit_link,
+    'comment_form': comment_form,
+}
+
+
+def punching(request):
+    """
+    Ставит ли текущий рендер метки вместо частей для зрителя.
+
+    Только рендер внутри posts.cache.conditional под
+    PageCacheMiddleware: такой ответ попадает в кэш страниц, и
+    middleware сшивает его для каждого зрителя. Другие представления,
+    страницы ошибок и render_to_string рисуют части сразу.
+    """
+    return getattr(request, 'punch_holes', False)
+
+
+def render(request, name, *args):
+    """Часть страницы для зрителя — то, что stitch подставит в метку."""
+    if request is None:
+        # render_to_string без запроса: части рисуются как для анонима.
+        request = HttpRequest()
+        request.user = AnonymousUser()
+    # Из метки аргументы возвращаются строками; здесь так же.
+    return HOLES[name](request, *(str(arg) for arg in args))
+
+
+def punch(name, *args):
+    """Метка на месте части страницы, зависящей от зрителя."""
+    if name not in HOLES:
+        raise ValueError(f'Неизвестная дырка {name!r}')
+    return MARKER.format(':'.join(
+        [name, *(quote(str(arg), safe='') for arg in args)]))
+
+
+def stitch(request, content, charset):
+    """
+    Заполняет метки в теле страницы частями для текущего зрителя.
+
+    Тело без меток возвращается как есть, поэтому страницы без
+    {% hole %} почти ничего не стоят.
+    """
+    if MARKER_START not in content:
+        return content
+
+    def fill(match):
+        name = match.group(1).decode()
+        args = [unquote(arg.decode(charset))
+                for arg in match.group(2).split(b':')[1:]]
+        return HOLES[name](request, *args).encode(charset)
+
+    return MARKER_RE.sub(fill, content)
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.exports import FORMATS, export_lines
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = ('Выгружает посты и комментарии пользователя в NDJSON или CSV '
+            'потоком, не загружая их в память целиком.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=sorted(FORMATS),
+                            default='ndjson')
+        parser.add_argument(
+            '--output', help='Файл для выгрузки; по умолчанию stdout.')
+
+    def handle(self, *args, username, format, output=None, **options):
+        author_id = (User.objects.filter(username=username)
+                     .values_list('pk', flat=True).first())
+        if author_id is None:
+            raise CommandError(f'Пользователь {username} не найден.')
+        lines = export_lines(author_id, format)
+        if output is None:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(output, 'w', encoding='utf-8', newline='') as file:
+            file.writelines(lines)
+        self.stderr.write(f'Выгрузка сохранена в {output}')
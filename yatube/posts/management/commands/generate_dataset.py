@@ -0,0 +1,273 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from posts import autocomplete, counters, timeline
+from posts.bulk import RowWriter
+from posts.cache import invalidate
+from posts.models import (Comment, Follow, Group, Post, PrefixEntry, User,
+                          UserStats)
+
+WORDS = ('яндекс', 'практикум', 'питон', 'джанго', 'лента', 'пост',
+         'подписка', 'группа', 'комментарий', 'кэш', 'индекс', 'запрос',
+         'сегодня', 'завтра', 'город', 'море', 'кофе', 'код', 'тест',
+         'релиз', 'ночь', 'утро', 'книга', 'фильм', 'музыка', 'друзья')
+
+
+def skewed(rnd, n, skew):
+    """
+    Индекс от 0 до n - 1 со степенным перекосом к началу.
+
+    Чем больше skew, тем сильнее «хвост»: при skew=3 десятая часть
+    элементов получает почти половину выборок. Памяти не требует,
+    поэтому годится для миллионов записей.
+    """
+    return min(n - 1, int(n * rnd.random() ** skew))
+
+
+class Command(BaseCommand):
+    help = ('Генерирует синтетический набор данных: пользователей, группы, '
+            'посты, комментарии и подписки со степенным распределением. '
+            'Результат полностью определяется параметром --seed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок на пользователя.')
+        parser.add_argument('--skew', type=float, default=3.0,
+                            help='Степень перекоса популярности авторов.')
+        parser.add_argument('--days', type=int, default=365,
+                            help='На сколько дней растянуть публикации.')
+        parser.add_argument('--start', default='2021-01-01',
+                            help='Дата самой ранней публикации, ГГГГ-ММ-ДД.')
+        parser.add_argument('--prefix', default='gen',
+                            help='Префикс имён пользователей и групп.')
+        parser.add_argument('--password', default='yatube',
+                            help='Общий пароль сгенерированных пользователей.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def check_options(self, options):
+        for name in ('users', 'groups', 'posts', 'comments', 'follows',
+                     'days'):
+            if options[name] < 0:
+                raise CommandError(f'--{name} не может быть отрицательным.')
+        if options['batch_size'] < 1 or options['skew'] <= 0:
+            raise CommandError('--batch-size и --skew должны быть больше 0.')
+        # Авторов постов и комментариев выбирают среди новых
+        # пользователей, а комментарии пишут к новым постам.
+        if options['posts'] and not options['users']:
+            raise CommandError('Для постов нужны пользователи: --users 0.')
+        if options['comments'] and not options['posts']:
+            raise CommandError('Для комментариев нужны посты: --posts 0.')
+
+    def handle(self, *args, **options):
+        self.check_options(options)
+        self.rnd = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+        self.prefix = options['prefix']
+        try:
+            self.start = timezone.make_aware(
+                datetime.strptime(options['start'], '%Y-%m-%d'))
+        except ValueError:
+            raise CommandError('--start ожидается в формате ГГГГ-ММ-ДД')
+        self.span = timedelta(days=options['days']).total_seconds()
+        if User.objects.filter(
+                username__startswith=f'{self.prefix}_').exists():
+            raise CommandError(f'Пользователи с префиксом {self.prefix}_ '
+                               f'уже есть, выберите другой --prefix.')
+
+        if connection.vendor == 'sqlite':
+            # Индексы растут вразнобой по датам: большой страничный кэш
+            # избавляет от постоянного чтения их страниц с диска.
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA cache_size = -262144')
+
+        started = time.perf_counter()
+        users = self.step('users', self.create_users,
+                          options['users'], options['password'])
+        groups = self.step('groups', self.create_groups, options['groups'])
+        posts = self.step('posts', self.create_posts,
+                          options['posts'], users, groups)
+        self.step('comments', self.create_comments,
+                  options['comments'], users, posts)
+        self.step('follows', self.create_follows,
+                  options['follows'], users)
+        # Все новые строки принадлежат новым пользователям, группам и
+        # постам: пересчитываются только они, чужие ленты не трогаются.
+        self.step('counters', self.recount, users, groups, posts)
+        self.step('timelines', timeline.rebuild_users, users)
+        self.step('autocomplete', self.index_prefixes, users, groups)
+        # Новые группы и профили ещё не кэшировались, меняется только
+        # главная лента.
+        invalidate('index')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.1f} с'))
+
+    def step(self, name, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - started
+        rows = len(result) if isinstance(result, range) else result
+        if isinstance(rows, int):
+            self.stdout.write(f'{name}: {rows} строк за {elapsed:.1f} с '
+                              f'({rows / max(elapsed, 1e-6):.0f} строк/с)')
+        else:
+            self.stdout.write(f'{name}: {elapsed:.1f} с')
+        return result
+
+    def recount(self, users, groups, posts):
+        for model, ids in ((UserStats, users), (Group, groups),
+                           (Post, posts)):
+            if ids:
+                counters.recount(model.objects.filter(
+                    pk__gte=ids[0], pk__lte=ids[-1]))
+
+    def index_prefixes(self, users, groups):
+        total = 0
+        for kind, model, ids in ((PrefixEntry.USER, User, users),
+                                 (PrefixEntry.GROUP, Group, groups)):
+            if ids:
+                queryset = model.objects.filter(pk__gte=ids[0],
+                                                pk__lte=ids[-1])
+                total += autocomplete.index_many(kind, queryset,
+                                                 self.batch_size)
+        return total
+
+    def insert(self, model, rows):
+        """Пишет объекты через bulk_create, пачка — своя транзакция."""
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                with transaction.atomic():
+                    model.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+
+    def insert_rows(self, model, fields, rows):
+        """Пишет кортежи значений пачками через RowWriter, без ORM."""
+        writer = RowWriter(model, fields)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                with transaction.atomic():
+                    writer.write(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                writer.write(batch)
+
+    def new_ids(self, model, before):
+        """
+        Диапазон id только что вставленных строк.
+
+        SQLite выдаёт id подряд, поэтому вместо списка из миллионов
+        id хватает границ диапазона.
+        """
+        created = model.objects.filter(pk__gt=before or 0)
+        bounds = created.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is None:
+            return range(0)
+        ids = range(bounds['first'], bounds['last'] + 1)
+        if created.count() != len(ids):
+            raise CommandError(f'Новые id {model.__name__} идут не подряд: '
+                               f'похоже, в базу писал кто-то ещё.')
+        return ids
+
+    def last_id(self, model):
+        return model.objects.aggregate(last=Max('pk'))['last']
+
+    def create_users(self, total, password):
+        before = self.last_id(User)
+        password = make_password(password)
+        self.insert(User, (
+            User(username=f'{self.prefix}_{i}', password=password,
+                 first_name=f'Автор {i}', date_joined=self.start)
+            for i in range(total)))
+        ids = self.new_ids(User, before)
+        self.insert(UserStats, (UserStats(user_id=pk) for pk in ids))
+        return ids
+
+    def create_groups(self, total):
+        before = self.last_id(Group)
+        self.insert(Group, (
+            Group(title=f'Группа {i}', slug=f'{self.prefix}-{i}',
+                  description=self.text(20))
+            for i in range(total)))
+        return self.new_ids(Group, before)
+
+    def text(self, words):
+        return ' '.join(self.rnd.choices(WORDS, k=words))
+
+    def date(self):
+        return self.start + timedelta(seconds=self.rnd.random() * self.span)
+
+    def create_posts(self, total, users, groups):
+        before = self.last_id(Post)
+        rnd = self.rnd
+
+        def rows():
+            for _ in range(total):
+                group = None
+                if groups and rnd.random() < 0.7:
+                    group = rnd.choice(groups)
+                author = users[skewed(rnd, len(users), self.skew)]
+                yield (self.text(rnd.randint(5, 60)), self.date(), author,
+                       group, '', '', '', 0)
+
+        self.insert_rows(Post, ('text', 'pub_date', 'author', 'group',
+                                'image', 'image_lqip', 'image_thumbnails',
+                                'comment_count'),
+                         rows())
+        return self.new_ids(Post, before)
+
+    def create_comments(self, total, users, posts):
+        if not posts:
+            return 0
+        rnd = self.rnd
+        self.insert_rows(Comment, ('post', 'author', 'text', 'created'), (
+            (posts[skewed(rnd, len(posts), self.skew)], rnd.choice(users),
+             self.text(rnd.randint(3, 30)), self.date())
+            for _ in range(total)))
+        return total
+
+    def create_follows(self, average, users):
+        """
+        Подписки: их число у пользователя распределено по Парето,
+        а авторов выбирают с тем же перекосом, что и при публикации.
+        """
+        rnd = self.rnd
+        total = 0
+
+        def rows():
+            nonlocal total
+            for user_id in users:
+                wanted = min(len(users) - 1,
+                             int(rnd.paretovariate(2.0) * average / 2))
+                authors = set()
+                for _ in range(wanted * 2):
+                    if len(authors) >= wanted:
+                        break
+                    author_id = users[skewed(rnd, len(users), self.skew)]
+                    if author_id != user_id:
+                        authors.add(author_id)
+                total += len(authors)
+                for author_id in sorted(authors):
+                    yield user_id, author_id
+
+        self.insert_rows(Follow, ('user', 'author'), rows())
+        return total
@@ -0,0 +1,315 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import counters, timeline
+from posts.bulk import RowWriter
+from posts.cache import invalidate
+from posts.models import Comment, Follow, Group, Post, User, UserStats
+
+COMMENT_MAX_LENGTH = Comment._meta.get_field('text').max_length
+MAX_REPORTED_ERRORS = 20
+# Что затронула загрузка: ленты подписок (timelines), авторы новых
+# постов (posters), профили, группы и посты с новыми комментариями.
+TOUCHED = ('timelines', 'posters', 'profiles', 'groups', 'posts')
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Загружает посты, комментарии и подписки из NDJSON: по записи '
+            'на строку с полем type = post, comment или follow. Посты и '
+            'комментарии сохраняют свои id. Пишет пачками в отдельных '
+            'транзакциях и после каждой запоминает позицию в файле, '
+            'поэтому прерванную загрузку можно продолжить. Счётчики, '
+            'ленты подписок и кэш обновляются только у затронутых '
+            'пользователей, групп и постов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл с позицией загрузки; по умолчанию <path>.checkpoint.')
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать с начала файла, не глядя на сохранённую позицию.')
+
+    def handle(self, *args, path, batch_size, checkpoint=None, restart=False,
+               **options):
+        self.checkpoint_path = checkpoint or f'{path}.checkpoint'
+        # Затронутые id дописываются в отдельный файл по строке на
+        # пачку: переписывать их целиком с каждой позицией — квадрат.
+        self.touched_path = f'{self.checkpoint_path}.touched'
+        state = {'offset': 0, 'line': 0, 'imported': {}, 'skipped': 0}
+        if not restart and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as file:
+                state = json.load(file)
+            self.stdout.write(f'Продолжаю со строки {state["line"] + 1}')
+        elif os.path.exists(self.touched_path):
+            os.remove(self.touched_path)
+
+        # Авторы и сообщества ищутся в словарях, а не запросом на строку.
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.writers = {
+            # Колонки без значений из файла заполняются явно: OR IGNORE
+            # в SQLite молча пропускает и строки с нарушением NOT NULL.
+            'post': RowWriter(Post, ('id', 'text', 'pub_date', 'author',
+                                     'group', 'image', 'image_lqip',
+                                     'image_thumbnails', 'comment_count'),
+                              ignore_conflicts=True),
+            'comment': RowWriter(Comment, ('id', 'post', 'author', 'text',
+                                           'created'),
+                                 ignore_conflicts=True),
+            'follow': RowWriter(Follow, ('user', 'author'),
+                                ignore_conflicts=True),
+        }
+        self.errors = 0
+
+        started = time.perf_counter()
+        rows = 0
+        try:
+            file = open(path, 'rb')
+        except OSError as error:
+            raise CommandError(f'Не удалось открыть {path}: {error}')
+        with file:
+            file.seek(state['offset'])
+            while True:
+                lines = []
+                for _ in range(batch_size):
+                    line = file.readline()
+                    if not line:
+                        break
+                    lines.append(line)
+                if not lines:
+                    break
+                imported, skipped = self.import_batch(lines, state['line'])
+                for kind, count in imported.items():
+                    state['imported'][kind] = (
+                        state['imported'].get(kind, 0) + count)
+                state['skipped'] += skipped
+                state['offset'] = file.tell()
+                state['line'] += len(lines)
+                self.save_checkpoint(state)
+                rows += len(lines)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{state["line"]} строк, {rows / max(elapsed, 1e-6):.0f} '
+                    f'строк/с')
+
+        self.stdout.write('Пересборка лент подписок и сброс кэша...')
+        self.finish()
+        elapsed = time.perf_counter() - started
+        imported = ', '.join(f'{kind}: {count}' for kind, count
+                             in sorted(state['imported'].items()))
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {elapsed:.1f} с ({rows / max(elapsed, 1e-6):.0f} '
+            f'строк/с). Загружено — {imported or "ничего"}, '
+            f'пропущено строк: {state["skipped"]}.'))
+
+    def save_touched(self, touched):
+        with open(self.touched_path, 'a') as file:
+            json.dump({kind: sorted(ids) for kind, ids in touched.items()},
+                      file)
+            file.write('\n')
+
+    def load_touched(self):
+        touched = {kind: set() for kind in TOUCHED}
+        if not os.path.exists(self.touched_path):
+            return touched
+        with open(self.touched_path) as file:
+            for line in file:
+                for kind, ids in json.loads(line).items():
+                    touched[kind].update(ids)
+        return touched
+
+    def finish(self):
+        """
+        Пересобирает ленты и сбрасывает кэш только того, что затронуто.
+
+        Ленты — у новых подписчиков и у подписчиков авторов новых
+        постов; кэш — главная лента, затронутые профили, группы и
+        посты. Счётчики уже пересчитаны в транзакциях пачек.
+        """
+        touched = self.load_touched()
+        users = set(touched['timelines'])
+        posters = sorted(touched['posters'])
+        for start in range(0, len(posters), counters.BATCH_SIZE):
+            users.update(Follow.objects.filter(
+                author_id__in=posters[start:start + counters.BATCH_SIZE])
+                .values_list('user_id', flat=True))
+        timeline.rebuild_users(users)
+        names = ['index']
+        names += [f'profile:{pk}' for pk in touched['profiles']]
+        names += [f'group:{pk}' for pk in touched['groups']]
+        names += [f'post:{pk}' for pk in touched['posts']]
+        invalidate(*names)
+        # Работа сделана: повторный запуск с той же позицией ничего
+        # не пересобирает.
+        if os.path.exists(self.touched_path):
+            os.remove(self.touched_path)
+
+    def save_checkpoint(self, state):
+        # Запись через временный файл: оборванная запись не испортит
+        # прежнюю позицию.
+        temporary = f'{self.checkpoint_path}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(state, file)
+        os.replace(temporary, self.checkpoint_path)
+
+    def import_batch(self, lines, first_line):
+        """
+        Проверяет и пишет пачку строк одной транзакцией.
+
+        Сначала все строки разбираются и проверяются, затем одним
+        запросом проверяется существование постов для комментариев,
+        и только потом всё пишется. Строки с ошибками пропускаются.
+        """
+        rows = {'post': [], 'comment': [], 'follow': []}
+        skipped = 0
+        for number, line in enumerate(lines, first_line + 1):
+            try:
+                kind, row = self.parse(line)
+            except InvalidRecord as error:
+                skipped += 1
+                self.report(number, error)
+                continue
+            rows[kind].append((number, row))
+
+        # Пост комментария: id -> (автор, группа), из пачки или из базы.
+        known_posts = {row[0]: (row[3], row[4]) for _, row in rows['post']}
+        wanted = {row[1] for _, row in rows['comment']} - set(known_posts)
+        if wanted:
+            known_posts.update(
+                (pk, (author_id, group_id)) for pk, author_id, group_id
+                in Post.objects.filter(pk__in=wanted)
+                .values_list('pk', 'author_id', 'group_id'))
+        comments = []
+        for number, row in rows['comment']:
+            if row[1] in known_posts:
+                comments.append((number, row))
+            else:
+                skipped += 1
+                self.report(number, f'нет поста {row[1]}')
+        rows['comment'] = comments
+
+        touched = self.touched(rows, known_posts)
+        imported = {}
+        with transaction.atomic():
+            for kind in ('post', 'comment', 'follow'):
+                if rows[kind]:
+                    imported[kind] = self.writers[kind].write(
+                        [row for _, row in rows[kind]])
+            # Счётчики затронутых строк пересчитываются в той же
+            # транзакции: пачка, повторённая после сбоя, даст то же.
+            counters.recount_ids(Post, touched['posts'])
+            counters.recount_ids(UserStats, touched['profiles'])
+            counters.recount_ids(Group, touched['groups'])
+            # До фиксации: после сбоя список затронутого будет шире
+            # записанного, но не уже.
+            self.save_touched(touched)
+        return imported, skipped
+
+    def touched(self, rows, known_posts):
+        """Id лент, профилей, групп и постов, которые меняет пачка."""
+        touched = {kind: set() for kind in TOUCHED}
+        for _, row in rows['post']:
+            touched['posters'].add(row[3])
+            touched['profiles'].add(row[3])
+            touched['groups'].add(row[4])
+        for _, row in rows['comment']:
+            author_id, group_id = known_posts[row[1]]
+            touched['posts'].add(row[1])
+            touched['profiles'].add(author_id)
+            touched['groups'].add(group_id)
+        for _, (user_id, author_id) in rows['follow']:
+            touched['timelines'].add(user_id)
+            touched['profiles'].update((user_id, author_id))
+        touched['groups'].discard(None)
+        return touched
+
+    def report(self, number, error):
+        self.errors += 1
+        if self.errors <= MAX_REPORTED_ERRORS:
+            self.stderr.write(f'Строка {number}: {error}')
+        elif self.errors == MAX_REPORTED_ERRORS + 1:
+            self.stderr.write('Дальнейшие ошибки не показываются.')
+
+    def parse(self, line):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise InvalidRecord('не JSON')
+        if not isinstance(record, dict):
+            raise InvalidRecord('ожидается объект')
+        kind = record.get('type')
+        parser = {'post': self.parse_post, 'comment': self.parse_comment,
+                  'follow': self.parse_follow}.get(kind)
+        if parser is None:
+            raise InvalidRecord(f'неизвестный type {kind!r}')
+        return kind, parser(record)
+
+    def user_id(self, record, field):
+        username = record.get(field)
+        if username not in self.users:
+            raise InvalidRecord(f'нет пользователя {username!r}')
+        return self.users[username]
+
+    def record_id(self, record, field='id'):
+        value = record.get(field)
+        if not isinstance(value, int) or isinstance(value, bool) \
+                or value <= 0:
+            raise InvalidRecord(f'{field} должен быть целым числом > 0')
+        return value
+
+    def text(self, record, max_length=None):
+        text = record.get('text')
+        if not isinstance(text, str) or not text.strip():
+            raise InvalidRecord('пустой text')
+        if max_length is not None and len(text) > max_length:
+            raise InvalidRecord(f'text длиннее {max_length} символов')
+        return text
+
+    def date(self, record, field):
+        value = record.get(field)
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+        if parsed is None:
+            raise InvalidRecord(f'{field} не дата ISO 8601')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def parse_post(self, record):
+        group_id = None
+        if record.get('group') is not None:
+            if record['group'] not in self.groups:
+                raise InvalidRecord(f'нет сообщества {record["group"]!r}')
+            group_id = self.groups[record['group']]
+        image = record.get('image') or ''
+        if not isinstance(image, str):
+            raise InvalidRecord('image должен быть путём к файлу')
+        return (self.record_id(record), self.text(record),
+                self.date(record, 'pub_date'),
+                self.user_id(record, 'author'), group_id, image, '', '',
+                0)
+
+    def parse_comment(self, record):
+        return (self.record_id(record), self.record_id(record, 'post'),
+                self.user_id(record, 'author'),
+                self.text(record, COMMENT_MAX_LENGTH),
+                self.date(record, 'created'))
+
+    def parse_follow(self, record):
+        user_id = self.user_id(record, 'user')
+        author_id = self.user_id(record, 'author')
+        if user_id == author_id:
+            raise InvalidRecord('подписка на самого себя')
+        return user_id, author_id
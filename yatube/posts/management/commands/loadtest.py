@@ -0,0 +1,295 @@
+import io
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY)
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+from PIL import Image
+
+from posts.models import Follow, Group, Post, User
+
+DEFAULT_MIX = 'feed=60,post=20,comment=8,follow=6,upload=6'
+ACTIONS = ('feed', 'post', 'comment', 'follow', 'upload')
+PERCENTILES = (50, 95, 99)
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        action, _, weight = part.partition('=')
+        action = action.strip()
+        if action not in ACTIONS:
+            raise CommandError(f'Неизвестное действие в --mix: {action}')
+        try:
+            mix[action] = int(weight)
+        except ValueError:
+            raise CommandError(f'Вес действия {action} должен быть числом')
+    if not any(mix.values()):
+        raise CommandError('В --mix нет ни одного действия с весом > 0')
+    return mix
+
+
+def percentile(values, rank):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, -(-rank * len(ordered) // 100) - 1)
+    return ordered[index]
+
+
+def multipart(fields, files):
+    boundary = get_random_string(24)
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; '
+                   f'name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content, content_type) in files.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; '
+                   f'name="{name}"; filename="{filename}"\r\n'
+                   f'Content-Type: {content_type}\r\n\r\n'.encode())
+        body.write(content + b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+class SimulatedUser:
+    """
+    Пользователь с готовой сессией и CSRF-токеном.
+
+    following — на кого он подписан, pending — подписки и отписки
+    в полёте ({путь: автор}): пока запрос не вернулся, этого автора
+    не трогаем, иначе отписка может обогнать подписку и получить 404.
+    """
+
+    def __init__(self, user, following=()):
+        self.user = user
+        self.following = set(following)
+        self.pending = {}
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        self.csrf = get_random_string(32)
+        self.session_key = session.session_key
+        self.cookie = (f'{settings.SESSION_COOKIE_NAME}={self.session_key}; '
+                       f'{settings.CSRF_COOKIE_NAME}={self.csrf}')
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон против запущенного сервера: смесь чтений '
+            'лент, постов, комментариев, подписок и загрузок картинок от '
+            'многих пользователей. Печатает RPS и p50/p95/p99 по именам URL.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help='Адрес запущенного сервера.')
+        parser.add_argument('--users', type=int, default=50,
+                            help='Сколько пользователей симулировать.')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Число одновременных запросов.')
+        parser.add_argument('--requests', type=int, default=1000,
+                            help='Сколько запросов отправить всего.')
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help='Веса действий: ' + ', '.join(ACTIONS))
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Зерно генератора для повторяемых прогонов.')
+        parser.add_argument('--output', default=None,
+                            help='Записать отчёт в JSON-файл.')
+
+    def handle(self, *args, **options):
+        self.base_url = options['url'].rstrip('/')
+        self.random = random.Random(options['seed'])
+        self.lock = threading.Lock()
+        mix = parse_mix(options['mix'])
+        self.load_targets(options['users'])
+        self.opener = urllib.request.build_opener(NoRedirect)
+        self.image = self.make_image()
+
+        actions = self.random.choices(
+            list(mix), weights=list(mix.values()), k=options['requests'])
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(options['concurrency']) as pool:
+                list(pool.map(self.run_action, actions))
+        finally:
+            for simulated in self.simulated:
+                SessionStore(simulated.session_key).delete()
+        elapsed = time.perf_counter() - started
+        report = self.build_report(elapsed)
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as fp:
+                json.dump(report, fp, ensure_ascii=False, indent=2)
+
+    def load_targets(self, users):
+        # Выбор через self.random, а не order_by('?'): с --seed прогон
+        # повторяется теми же пользователями.
+        ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        chosen = self.random.sample(ids, min(users, len(ids)))
+        by_id = User.objects.in_bulk(chosen)
+        following = defaultdict(list)
+        for user_id, author in (Follow.objects.filter(user__in=chosen)
+                                .values_list('user_id', 'author__username')):
+            following[user_id].append(author)
+        self.simulated = [SimulatedUser(by_id[pk], following[pk])
+                          for pk in chosen]
+        if not self.simulated:
+            raise CommandError('В базе нет пользователей для симуляции.')
+        self.posts = list(Post.objects.order_by('-pub_date')
+                          .values_list('author__username', 'id')[:1000])
+        self.groups = list(Group.objects.values_list('slug', flat=True))
+        self.usernames = [simulated.user.username
+                          for simulated in self.simulated]
+
+    def make_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), (90, 140, 200)).save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+    def pick_post(self):
+        if not self.posts:
+            return None
+        return self.random.choice(self.posts)
+
+    def plan_follow(self, simulated):
+        """Подписка на нового автора или отписка от одного из своих."""
+        busy = set(simulated.pending.values())
+        followed = sorted(simulated.following - busy)
+        others = [username for username in self.usernames
+                  if username != simulated.user.username
+                  and username not in simulated.following
+                  and username not in busy]
+        if not followed and not others:
+            return None
+        if followed and (not others or self.random.random() < 0.5):
+            name, author = 'profile_unfollow', self.random.choice(followed)
+        else:
+            name, author = 'profile_follow', self.random.choice(others)
+        path = reverse(name, args=[author])
+        simulated.pending[path] = author
+        return name, path, None, None
+
+    def finish_follow(self, simulated, name, path, status):
+        # Подписки меняются, только если сервер их принял.
+        author = simulated.pending.pop(path)
+        if status is None or status >= 400:
+            return
+        if name == 'profile_follow':
+            simulated.following.add(author)
+        else:
+            simulated.following.discard(author)
+
+    def plan(self, action, simulated):
+        """Возвращает (имя URL, путь, данные POST, файлы) для действия."""
+        rnd = self.random
+        if action == 'feed':
+            choices = [('index', reverse('index')),
+                       ('follow_index', reverse('follow_index')),
+                       ('profile', reverse(
+                           'profile', args=[rnd.choice(self.usernames)]))]
+            if self.groups:
+                choices.append(('slug', reverse(
+                    'slug', args=[rnd.choice(self.groups)])))
+            name, path = rnd.choice(choices)
+            return name, path, None, None
+        if action == 'follow':
+            return (self.plan_follow(simulated)
+                    or self.plan('feed', simulated))
+        if action == 'upload':
+            fields = {'text': f'Нагрузочный пост {get_random_string(8)}'}
+            files = {'image': ('load.jpg', self.image, 'image/jpeg')}
+            return 'new_post', reverse('new_post'), fields, files
+        post = self.pick_post()
+        if post is None:
+            return self.plan('feed', simulated)
+        if action == 'comment':
+            fields = {'text': f'Нагрузочный комментарий {rnd.random()}'}
+            path = reverse('add_comment', args=post)
+            return 'add_comment', path, fields, None
+        return 'post', reverse('post', args=post), None, None
+
+    def run_action(self, action):
+        with self.lock:
+            simulated = self.random.choice(self.simulated)
+            name, path, fields, files = self.plan(action, simulated)
+        headers = {'Cookie': simulated.cookie}
+        data = None
+        if fields is not None:
+            fields['csrfmiddlewaretoken'] = simulated.csrf
+            if files:
+                data, content_type = multipart(fields, files)
+            else:
+                data = urlencode(fields).encode()
+                content_type = 'application/x-www-form-urlencoded'
+            headers['Content-Type'] = content_type
+        request = urllib.request.Request(self.base_url + path, data=data,
+                                         headers=headers)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as error:
+            status = error.code
+        except OSError:
+            status = None
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            if path in simulated.pending:
+                self.finish_follow(simulated, name, path, status)
+            self.samples[name].append(elapsed)
+            if status is None or status >= 400:
+                self.errors[name] += 1
+
+    def build_report(self, elapsed):
+        report = {'elapsed': round(elapsed, 3), 'urls': {}}
+        total = 0
+        for name, samples in sorted(self.samples.items()):
+            total += len(samples)
+            stats = {
+                'requests': len(samples),
+                'errors': self.errors[name],
+                'rps': round(len(samples) / elapsed, 2),
+                'mean_ms': round(statistics.mean(samples) * 1000, 2),
+            }
+            for rank in PERCENTILES:
+                stats[f'p{rank}_ms'] = round(
+                    percentile(samples, rank) * 1000, 2)
+            report['urls'][name] = stats
+        report['requests'] = total
+        report['rps'] = round(total / elapsed, 2) if elapsed else 0
+        return report
+
+    def print_report(self, report):
+        header = (f'{"URL":<18}{"запросов":>10}{"ошибок":>8}{"RPS":>9}'
+                  + ''.join(f'{f"p{rank}, мс":>11}' for rank in PERCENTILES))
+        self.stdout.write(header)
+        for name, stats in report['urls'].items():
+            self.stdout.write(
+                f'{name:<18}{stats["requests"]:>10}{stats["errors"]:>8}'
+                f'{stats["rps"]:>9}'
+                + ''.join(f'{stats[f"p{rank}_ms"]:>11}'
+                          for rank in PERCENTILES))
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего {report["requests"]} запросов за {report["elapsed"]} с, '
+            f'{report["rps"]} RPS'))
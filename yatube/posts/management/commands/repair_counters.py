@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = ('Сверяет денормализованные счётчики постов, групп и '
+            'пользователей с фактическими данными и чинит расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не меняя.')
+
+    def handle(self, *args, dry_run=False, **options):
+        if not dry_run:
+            created = counters.create_missing_stats()
+            if created:
+                self.stdout.write(f'UserStats: создано строк {created}')
+        total = 0
+        for model, fields in counters.COUNTERS:
+            with transaction.atomic():
+                drifted = counters.repair(model, fields, dry_run=dry_run)
+            total += drifted
+            self.stdout.write(
+                f'{model.__name__}: расхождений {drifted}')
+        if dry_run and total:
+            self.stdout.write(self.style.WARNING(
+                f'Найдено расхождений: {total}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Счётчики в порядке.'))
@@ -0,0 +1,85 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+
+from .cache import feed_changed, set_validators, validators
+from .holes import stitch
+
+PAGE_KEY = 'page:{}'
+
+
+class PageCacheMiddleware:
+    """
+    Кэш целых страниц, общий для всех зрителей.
+
+    Кэшируются только ответы, помеченные представлением: у них есть
+    response.surrogate_keys — ленты страницы и время их изменения на
+    момент рендера (см. posts.cache.conditional). Запись действительна,
+    пока это время не поменялось, поэтому сигналы, сбрасывающие ленту
+    или пост, сбрасывают ровно зависящие от них страницы.
+
+    В кэше лежит тело с метками {% hole %}: навигация, кнопка подписки,
+    ссылка «Редактировать» и форма комментария дорисовываются для
+    каждого запроса (posts.holes), так что вошедшие пользователи
+    получают то же тело, что и анонимы. Для анонимов попадание
+    в кэш обходится без базы. Те же ленты уходят в заголовке
+    Surrogate-Key; прокси может хранить анонимные страницы, но пока
+    очистки по этим ключам нет, s-maxage равен PROXY_CACHE_TIMEOUT (0):
+    каждый запрос прокси перепроверяет и получает 304.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cacheable = request.method in ('GET', 'HEAD')
+        # Отметка для posts.cache.conditional: ответ будет закэширован
+        # и сшит здесь, значит, в нём можно ставить метки {% hole %}.
+        request.page_cache = cacheable
+        if cacheable:
+            key = PAGE_KEY.format(hashlib.md5(
+                request.build_absolute_uri().encode()).hexdigest())
+            response = self.cached(request, key)
+            if response is not None:
+                return self.finish(request, response)
+
+        response = self.get_response(request)
+        if (cacheable and request.method == 'GET'
+                and response.status_code == 200
+                and hasattr(response, 'surrogate_keys')
+                and not response.cookies and not response.streaming):
+            cache.set(key, response, settings.PAGE_CACHE_TIMEOUT)
+        return self.finish(request, response)
+
+    def cached(self, request, key):
+        response = cache.get(key)
+        if response is None:
+            return None
+        changed = response.surrogate_keys
+        if feed_changed(*changed) != changed:
+            return None
+        etag, last_modified = validators(request, response.page_tag, changed)
+        set_validators(response, etag, last_modified)
+        return get_conditional_response(
+            request, etag=etag, last_modified=last_modified,
+            response=response)
+
+    def finish(self, request, response):
+        surrogate_keys = getattr(response, 'surrogate_keys', None)
+        if surrogate_keys is not None:
+            response['Surrogate-Key'] = ' '.join(sorted(surrogate_keys))
+            patch_vary_headers(response, ('Cookie',))
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True)
+            else:
+                patch_cache_control(response, public=True, max_age=0,
+                                    s_maxage=settings.PROXY_CACHE_TIMEOUT)
+            # Метки есть только в ответах conditional, то есть в тех,
+            # что хранит этот кэш; остальные страницы не сканируются.
+            if (not response.streaming and response.get(
+                    'Content-Type', '').startswith('text/html')):
+                response.content = stitch(request, response.content,
+                                          response.charset)
+        return response
@@ -0,0 +1,82 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Значения настроек на момент миграции: её результат не должен
+# зависеть от того, как их поменяют потом.
+TIMELINE_LENGTH = 500
+TIMELINE_FANOUT_LIMIT = 1000
+
+# Одним INSERT ... SELECT, как timeline.rebuild_all: у каждого
+# пользователя TIMELINE_LENGTH свежих постов его авторов, кроме
+# авторов с подписчиками сверх TIMELINE_FANOUT_LIMIT — их посты
+# подмешиваются при чтении. Подписки до 0008 могут повторяться.
+FILL_SQL = """
+    WITH follows AS (
+        SELECT DISTINCT user_id, author_id FROM {follows}
+    ), recent AS (
+        SELECT id, author_id, pub_date FROM (
+            SELECT id, author_id, pub_date,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY author_id
+                       ORDER BY pub_date DESC, id DESC) AS position
+            FROM {posts}
+        ) numbered
+        WHERE position <= %s
+    )
+    INSERT INTO {entries} (user_id, post_id, pub_date)
+    SELECT user_id, post_id, pub_date FROM (
+        SELECT f.user_id, p.id AS post_id, p.pub_date,
+               ROW_NUMBER() OVER (
+                   PARTITION BY f.user_id
+                   ORDER BY p.pub_date DESC, p.id DESC) AS position
+        FROM follows f
+        CROSS JOIN recent p ON p.author_id = f.author_id
+        WHERE f.author_id NOT IN (
+            SELECT author_id FROM follows
+            GROUP BY author_id HAVING COUNT(*) > %s)
+    ) ranked
+    WHERE position <= %s
+"""
+
+
+def fill_timelines(apps, schema_editor):
+    sql = FILL_SQL.format(
+        follows=apps.get_model('posts', 'Follow')._meta.db_table,
+        posts=apps.get_model('posts', 'Post')._meta.db_table,
+        entries=apps.get_model('posts', 'TimelineEntry')._meta.db_table)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(sql, [TIMELINE_LENGTH, TIMELINE_FANOUT_LIMIT,
+                             TIMELINE_LENGTH])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0005_follow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date'], name='timeline_user_pub_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:47
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(model, field):
+    subquery = (model.objects.filter(**{field: OuterRef('pk')})
+                .order_by().values(field)
+                .annotate(total=Count('pk')).values('total'))
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), 0)
+
+
+def drop_duplicate_follows(apps, schema_editor):
+    """
+    Удаляет повторные подписки перед уникальным ограничением.
+
+    Удаление идёт мимо сигналов, а счётчики из 0007 посчитаны вместе
+    с дублями, поэтому у затронутых пользователей они пересчитываются.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    duplicates = (Follow.objects.values('user', 'author')
+                  .annotate(first=Min('id'), total=Count('id'))
+                  .filter(total__gt=1))
+    affected = set()
+    for row in duplicates:
+        (Follow.objects.filter(user=row['user'], author=row['author'])
+         .exclude(id=row['first']).delete())
+        affected.update((row['user'], row['author']))
+    affected = sorted(affected)
+    for start in range(0, len(affected), 500):
+        UserStats.objects.filter(pk__in=affected[start:start + 500]).update(
+            follower_count=_count(Follow, 'author'),
+            following_count=_count(Follow, 'user'),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='timelineentry',
+            name='timeline_user_pub_date',
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created', 'id'], name='comment_post_created'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-pub_date', '-id'], name='post_pub_date_id'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_pub_date'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='post_group_pub_date'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_pub_date_post'),
+        ),
+        migrations.RunPython(drop_duplicate_follows,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+from posts import fts_schema
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            fts_schema.run((fts_schema.TABLE_SQL, *fts_schema.TRIGGERS_SQL,
+                            fts_schema.REBUILD_SQL)),
+            fts_schema.run(fts_schema.DROP_SQL)),
+    ]
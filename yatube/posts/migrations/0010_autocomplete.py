@@ -0,0 +1,67 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:06
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalize(value):
+    # Копия posts.autocomplete.normalize на момент миграции: миграция
+    # не должна меняться вместе с кодом приложения.
+    value = unicodedata.normalize('NFKC', value).casefold()
+    return ' '.join(value.replace('ё', 'е').split())
+
+
+def fill_prefix_entries(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    Group = apps.get_model('posts', 'Group')
+    PrefixEntry = apps.get_model('posts', 'PrefixEntry')
+    entries = []
+    for user in User.objects.all().iterator():
+        full_name = f'{user.first_name} {user.last_name}'.strip()
+        label = f'{user.username} ({full_name})' if full_name else user.username
+        keys = {normalize(user.username)}
+        keys.update(normalize(word) for word in full_name.split())
+        entries.extend(PrefixEntry(kind='user', key=key[:200],
+                                   object_id=user.pk, slug=user.username,
+                                   label=label)
+                       for key in keys if key)
+    for group in Group.objects.all().iterator():
+        keys = {normalize(group.title), normalize(group.slug)}
+        keys.update(normalize(word) for word in group.title.split())
+        entries.extend(PrefixEntry(kind='group', key=key[:200],
+                                   object_id=group.pk, slug=group.slug,
+                                   label=group.title)
+                       for key in keys if key)
+    PrefixEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0009_post_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrefixEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'Пользователь'), ('group', 'Сообщество')], max_length=5)),
+                ('key', models.CharField(max_length=200)),
+                ('object_id', models.PositiveIntegerField()),
+                ('slug', models.CharField(max_length=150)),
+                ('label', models.CharField(max_length=350)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='prefixentry',
+            index=models.Index(fields=['kind', 'key', 'object_id'], name='prefix_kind_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='prefixentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id', 'key'), name='unique_prefix_entry'),
+        ),
+        migrations.RunPython(fill_prefix_entries, migrations.RunPython.noop),
+    ]
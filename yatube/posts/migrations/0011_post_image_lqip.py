@@ -0,0 +1,31 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+from posts import fts_schema
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_autocomplete'),
+    ]
+
+    operations = [
+        # При откате RemoveField тоже пересоздаёт posts_post, поэтому
+        # триггеры восстанавливаются после него: откат операций идёт
+        # в обратном порядке.
+        migrations.RunPython(migrations.RunPython.noop,
+                             fts_schema.run(fts_schema.RECREATE_TRIGGERS_SQL)),
+        migrations.AddField(
+            model_name='post',
+            name='image_lqip',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Превью картинки'),
+        ),
+        # SQLite пересоздаёт posts_post при AddField, и триггеры
+        # полнотекстового индекса из 0009 пропадают вместе со старой
+        # таблицей. rowid постов сохраняются, поэтому достаточно заново
+        # создать триггеры.
+        migrations.RunPython(fts_schema.run(fts_schema.TRIGGERS_SQL),
+                             migrations.RunPython.noop),
+    ]
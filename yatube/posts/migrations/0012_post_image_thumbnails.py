@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:13
+
+from django.db import migrations, models
+
+from posts import fts_schema
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_image_lqip'),
+    ]
+
+    operations = [
+        # При откате RemoveField тоже пересоздаёт posts_post, поэтому
+        # триггеры восстанавливаются после него: откат операций идёт
+        # в обратном порядке.
+        migrations.RunPython(migrations.RunPython.noop,
+                             fts_schema.run(fts_schema.RECREATE_TRIGGERS_SQL)),
+        migrations.AddField(
+            model_name='post',
+            name='image_thumbnails',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Миниатюры'),
+        ),
+        # Как и в 0011: AddField пересоздаёт posts_post в SQLite, а с
+        # ней пропадают триггеры полнотекстового индекса.
+        migrations.RunPython(fts_schema.run(fts_schema.TRIGGERS_SQL),
+                             migrations.RunPython.noop),
+    ]
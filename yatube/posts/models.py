@@ -14,11 +14,26 @@ class Group(models.Model):
     description = models.TextField(verbose_name='Описание',
                                    help_text='Дайте подробное описание группы',
                                    null=True, blank=True)
+    post_count = models.PositiveIntegerField(verbose_name='Записей',
+                                             default=0, editable=False)
 
     def __str__(self):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """
+        Посты для лент и списков.
+
+        Автор и группа приходят тем же запросом через JOIN, число
+        комментариев хранится в колонке comment_count, а адреса
+        миниатюр — в image_thumbnails, поэтому страница рендерится за
+        постоянное число запросов при любом её размере.
+        """
+        return self.select_related('author', 'group')
+
+
 class Post(models.Model):
     text = models.TextField(verbose_name='Текст',
                             help_text='Введите текст')
@@ -33,9 +48,26 @@ class Post(models.Model):
                               on_delete=models.SET_NULL, null=True,
                               blank=True, related_name='group_posts')
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    image_lqip = models.TextField(verbose_name='Превью картинки',
+                                  blank=True, default='', editable=False)
+    comment_count = models.PositiveIntegerField(verbose_name='Комментариев',
+                                                default=0, editable=False)
+    image_thumbnails = models.TextField(verbose_name='Миниатюры',
+                                        blank=True, default='',
+                                        editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_id'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -54,6 +86,12 @@ class Comment(models.Model):
     created = models.DateTimeField(verbose_name='Дата создания комментария',
                                    auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created', 'id'],
+                         name='comment_post_created'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -62,3 +100,80 @@ class Follow(models.Model):
     author = models.ForeignKey(
         User, on_delete=models.CASCADE,
         related_name="following")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_follow'),
+        ]
+
+
+class UserStats(models.Model):
+    """
+    Счётчики пользователя, которые поддерживаются при записи.
+
+    Карточка профиля читает их одной строкой вместо трёх COUNT(*).
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name='stats')
+    post_count = models.PositiveIntegerField(verbose_name='Записей',
+                                             default=0)
+    follower_count = models.PositiveIntegerField(verbose_name='Подписчиков',
+                                                 default=0)
+    following_count = models.PositiveIntegerField(verbose_name='Подписок',
+                                                  default=0)
+
+
+class TimelineEntry(models.Model):
+    """
+    Запись материализованной ленты подписок пользователя.
+
+    Заполняется при публикации поста (fan-out on write), поэтому
+    follow_index читает готовую ленту, а не соединение через Follow.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='timeline')
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE,
+        related_name='timeline_entries')
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_pub_date_post'),
+        ]
+
+
+class PrefixEntry(models.Model):
+    """
+    Строка префиксного индекса для автодополнения.
+
+    Хранит нормализованный ключ (имя пользователя, слово из имени или
+    названия сообщества), поэтому поиск по началу строки — это поиск
+    диапазона по индексу (kind, key), а не icontains по всей таблице.
+    """
+    USER = 'user'
+    GROUP = 'group'
+    KINDS = ((USER, 'Пользователь'), (GROUP, 'Сообщество'))
+
+    kind = models.CharField(max_length=5, choices=KINDS)
+    key = models.CharField(max_length=200)
+    object_id = models.PositiveIntegerField()
+    slug = models.CharField(max_length=150)
+    label = models.CharField(max_length=350)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id', 'key'],
+                                    name='unique_prefix_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'key', 'object_id'],
+                         name='prefix_kind_key'),
+        ]
@@ -0,0 +1,226 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+
+
+class UnknownTotal(AttributeError):
+    """
+    Курсорная пагинация не знает общего числа записей и страниц.
+
+    В шаблоне обращение к этим полям даёт пустое значение, а не 500.
+    """
+    silent_variable_failure = True
+
+
+class PrefetchList:
+    """Записи страницы, которые при первом чтении передаются в prefetch."""
+
+    def __init__(self, object_list, prefetch):
+        self._source = object_list
+        self._prefetch = prefetch
+        self._objects = None
+
+    def _fetch(self):
+        if self._objects is None:
+            self._objects = list(self._source)
+            self._prefetch(self._objects)
+        return self._objects
+
+    def __len__(self):
+        return len(self._fetch())
+
+    def __iter__(self):
+        return iter(self._fetch())
+
+
+class PrefetchPaginator(Paginator):
+    """
+    Paginator с дозагрузкой данных для записей страницы.
+
+    prefetch(objects) вызывается один раз, когда записи страницы
+    впервые читаются, как prefetch_related_objects: страница, чей
+    фрагмент уже лежит в кэше, не платит ни за записи, ни за
+    дозагрузку.
+    """
+    def __init__(self, object_list, per_page, prefetch=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.prefetch = prefetch
+
+    def prefetch_objects(self, objects):
+        if self.prefetch is not None:
+            self.prefetch(objects)
+
+    def _get_page(self, object_list, *args, **kwargs):
+        if self.prefetch is not None:
+            object_list = PrefetchList(object_list, self.prefetch)
+        return super()._get_page(object_list, *args, **kwargs)
+
+
+class CursorPage(Page):
+    """
+    Страница курсорной пагинации.
+
+    Повторяет интерфейс Page, которым пользуются шаблоны, но вместо
+    номера страницы хранит непрозрачные курсоры соседних страниц.
+    Запрос к базе выполняется лениво, при первом обращении к записям.
+    """
+    is_cursor = True
+
+    def __init__(self, paginator, after=None, before=None):
+        self.paginator = paginator
+        self.number = None
+        self._after = after
+        self._before = before
+        self._object_list = None
+        self._has_next = False
+        self._has_previous = False
+
+    def __repr__(self):
+        return '<CursorPage after=%r before=%r>' % (
+            self._after, self._before)
+
+    @property
+    def object_list(self):
+        if self._object_list is None:
+            self._fetch()
+        return self._object_list
+
+    def _fetch(self):
+        paginator = self.paginator
+        per_page = paginator.per_page
+        if self._before is not None:
+            rows = list(paginator.slice(self._before, reverse=True)
+                        [:per_page + 1])
+            self._has_previous = len(rows) > per_page
+            self._has_next = True
+            self._object_list = rows[:per_page][::-1]
+        else:
+            rows = list(paginator.slice(self._after)[:per_page + 1])
+            self._has_next = len(rows) > per_page
+            self._has_previous = self._after is not None
+            self._object_list = rows[:per_page]
+        paginator.prefetch_objects(self._object_list)
+
+    def has_next(self):
+        self.object_list
+        return self._has_next
+
+    def has_previous(self):
+        self.object_list
+        return self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self.has_next():
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous():
+            return None
+        return self.paginator.encode_cursor(self.object_list[0])
+
+
+class CursorPaginator(PrefetchPaginator):
+    """
+    Keyset-пагинация по упорядоченным полям, по умолчанию (pub_date, id).
+
+    Глубокие страницы стоят столько же, сколько первая: вместо
+    COUNT(*) и OFFSET выполняется один запрос с условием по ключу
+    последней показанной записи.
+    """
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-id'),
+                 prefetch=None):
+        super().__init__(object_list, per_page, prefetch)
+        descending = {field.startswith('-') for field in ordering}
+        if len(descending) != 1:
+            raise ValueError('Все поля курсора должны сортироваться '
+                             'в одном направлении.')
+        self.ordering = tuple(ordering)
+        self.descending = descending.pop()
+        self.fields = tuple(field.lstrip('-') for field in ordering)
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, field) for field in self.fields]
+        raw = json.dumps(values, default=str).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает значения ключа или None, если курсор испорчен."""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded))
+            if len(values) != len(self.fields):
+                return None
+            model = self.object_list.model
+            return [model._meta.get_field(field).to_python(value)
+                    for field, value in zip(self.fields, values)]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            return None
+
+    def slice(self, values, reverse=False):
+        """Записи строго после ключа values в порядке сортировки."""
+        descending = self.descending != reverse
+        ordering = [('-' if descending else '') + field
+                    for field in self.fields]
+        queryset = self.object_list.order_by(*ordering)
+        if values is None:
+            return queryset
+        lookup = 'lt' if descending else 'gt'
+        # Избыточное условие на первое поле даёт SQLite диапазон для
+        # поиска по индексу: одно OR-условие ниже индексом не ищется.
+        bound = Q(**{f'{self.fields[0]}__{lookup}e': values[0]})
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            step = Q(**{f'{field}__{lookup}': values[index]})
+            for prev_field, prev_value in zip(self.fields[:index],
+                                              values[:index]):
+                step &= Q(**{prev_field: prev_value})
+            condition |= step
+        return queryset.filter(bound, condition)
+
+    def get_page(self, after=None, before=None):
+        if before:
+            values = self.decode_cursor(before)
+            if values is not None:
+                return CursorPage(self, before=values)
+        after_values = self.decode_cursor(after) if after else None
+        return CursorPage(self, after=after_values)
+
+    @property
+    def count(self):
+        raise UnknownTotal('CursorPaginator не считает общее число записей.')
+
+    @property
+    def num_pages(self):
+        raise UnknownTotal('CursorPaginator не знает общего числа страниц.')
+
+    @property
+    def page_range(self):
+        raise UnknownTotal('CursorPaginator не знает общего числа страниц.')
+
+
+def paginate(request, object_list, view_name, prefetch=None):
+    """
+    Возвращает страницу ленты в режиме, выбранном для представления.
+
+    Режим задаётся в settings.FEED_PAGINATION: 'cursor' включает
+    курсоры ?after=/?before=, всё остальное — обычные номера страниц.
+    Ссылки вида ?page=N продолжают работать и в курсорном режиме.
+    prefetch(objects) дозагружает данные для записей страницы.
+    """
+    mode = settings.FEED_PAGINATION.get(view_name, 'page')
+    if mode == 'cursor' and 'page' not in request.GET:
+        paginator = CursorPaginator(object_list, settings.POSTS_PER_PAGE,
+                                    prefetch=prefetch)
+        return paginator.get_page(after=request.GET.get('after'),
+                                  before=request.GET.get('before'))
+    paginator = PrefetchPaginator(object_list, settings.POSTS_PER_PAGE,
+                                  prefetch=prefetch)
+    return paginator.get_page(request.GET.get('page'))
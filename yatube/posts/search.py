@@ -0,0 +1,144 @@
+import base64
+import binascii
+import json
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from . import thumbnails
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+
+# Границы подсветки в snippet(): управляющие символы не встречаются
+# в тексте постов, поэтому их можно безопасно заменить на <mark>
+# после экранирования HTML.
+MARK_START = '\x02'
+MARK_END = '\x03'
+SNIPPET_TOKENS = 24
+
+
+def match_expression(query):
+    """
+    Превращает пользовательский запрос в выражение MATCH для FTS5.
+
+    Каждое слово берётся в кавычки, поэтому операторы FTS5 (AND, NEAR,
+    *, ^ и скобки) из строки поиска не интерпретируются. Возвращает
+    пустую строку, если в запросе нет ни одного слова.
+    """
+    terms = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def encode_cursor(rank, post_id):
+    raw = json.dumps([rank, post_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Возвращает (rank, id) или None, если курсор испорчен."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        rank, post_id = json.loads(base64.urlsafe_b64decode(padded))
+        return float(rank), int(post_id)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+def highlight(snippet):
+    return mark_safe(escape(snippet)
+                     .replace(MARK_START, '<mark>')
+                     .replace(MARK_END, '</mark>'))
+
+
+class SearchPage:
+    """
+    Страница результатов поиска: посты с подсветкой и курсор дальше.
+
+    Посты упорядочены по релевантности (bm25), при равной
+    релевантности — по id. У каждого поста есть атрибут snippet.
+    """
+    def __init__(self, posts, next_cursor=None):
+        self.object_list = posts
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def search_posts(query, per_page, group=None, author=None, after=None):
+    """
+    Ищет посты по словам запроса.
+
+    group и author — slug сообщества и имя автора для фильтрации,
+    after — курсор со страницы выше. Страница читается одним
+    запросом к индексу FTS5 и одним запросом за самими постами,
+    поэтому время ответа не зависит от размера таблицы постов,
+    а только от числа совпадений.
+    """
+    expression = match_expression(query)
+    if not expression:
+        return SearchPage([])
+
+    joins = []
+    conditions = [f'{FTS_TABLE} MATCH %s']
+    params = [expression]
+    if group:
+        joins.append('JOIN posts_group g ON g.id = p.group_id')
+        conditions.append('g.slug = %s')
+        params.append(group)
+    if author:
+        joins.append('JOIN auth_user u ON u.id = p.author_id')
+        conditions.append('u.username = %s')
+        params.append(author)
+    cursor_values = decode_cursor(after) if after else None
+    if cursor_values is not None:
+        conditions.append('(f.rank > %s OR (f.rank = %s AND p.id > %s))')
+        rank, post_id = cursor_values
+        params.extend([rank, rank, post_id])
+
+    sql = f"""
+        SELECT p.id, f.rank,
+               snippet({FTS_TABLE}, 0, %s, %s, '…', {SNIPPET_TOKENS})
+        FROM {FTS_TABLE} f
+        JOIN posts_post p ON p.id = f.rowid
+        {' '.join(joins)}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY f.rank, p.id
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [MARK_START, MARK_END, *params, per_page + 1])
+        rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    posts = Post.objects.for_feed().in_bulk([row[0] for row in rows])
+    results = []
+    for post_id, _, snippet in rows:
+        post = posts.get(post_id)
+        if post is None:
+            continue
+        post.snippet = highlight(snippet)
+        results.append(post)
+    thumbnails.prefetch(results)
+    return SearchPage(results, next_cursor)
+
+
+def search_post_ids(query):
+    """Подзапрос id постов, подходящих под запрос, для админки."""
+    expression = match_expression(query)
+    if not expression:
+        return None
+    return (f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [expression])
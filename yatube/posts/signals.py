@@ -0,0 +1,198 @@
+import threading
+
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from . import autocomplete, thumbnails, timeline
+from .cache import invalidate, post_feeds, touch
+from .counters import bump
+from .models import (Comment, Follow, Group, Post, PrefixEntry, User,
+                     UserStats)
+
+
+@receiver(post_save, sender=User)
+def user_create_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_init, sender=Post)
+def post_remember_group(sender, instance, **kwargs):
+    # Пост, загруженный через only() без group_id, не трогаем: чтение
+    # отложенного поля стоило бы отдельного запроса на каждый пост.
+    if 'group_id' in instance.__dict__:
+        instance._initial_group_id = instance.group_id
+
+
+def initial_group_id(post):
+    return post.__dict__.get('_initial_group_id', post.group_id)
+
+
+@receiver(post_save, sender=Post)
+def post_count_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        bump(UserStats, instance.author_id, post_count=1)
+        bump(Group, instance.group_id, post_count=1)
+    elif initial_group_id(instance) != instance.group_id:
+        bump(Group, initial_group_id(instance), post_count=-1)
+        bump(Group, instance.group_id, post_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def post_count_deleted(sender, instance, **kwargs):
+    bump(UserStats, instance.author_id, post_count=-1)
+    bump(Group, initial_group_id(instance), post_count=-1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_invalidate_feeds(sender, instance, **kwargs):
+    names = post_feeds(instance.author_id, instance.group_id, instance.pk)
+    if initial_group_id(instance) is not None:
+        names.append(f'group:{initial_group_id(instance)}')
+    invalidate(*names)
+    instance._initial_group_id = instance.group_id
+
+
+# Посты, которые сейчас удаляются в этом потоке. Их комментарии Django
+# удаляет каскадом раньше самого поста: обновлять счётчик и ленты поста
+# на каждый комментарий незачем, ленты сбросит post_invalidate_feeds.
+_deleting = threading.local()
+
+
+def deleting_posts():
+    if not hasattr(_deleting, 'posts'):
+        _deleting.posts = set()
+    return _deleting.posts
+
+
+@receiver(pre_delete, sender=Post)
+def post_mark_deleting(sender, instance, **kwargs):
+    deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_unmark_deleting(sender, instance, **kwargs):
+    deleting_posts().discard(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def comment_count_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump(Post, instance.post_id, comment_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_count_deleted(sender, instance, **kwargs):
+    if instance.post_id not in deleting_posts():
+        bump(Post, instance.post_id, comment_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_invalidate_feeds(sender, instance, **kwargs):
+    if instance.post_id in deleting_posts():
+        return
+    post = (Post.objects.filter(pk=instance.post_id)
+            .values_list('author_id', 'group_id').first())
+    if post is not None:
+        invalidate(*post_feeds(*post, instance.post_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_invalidate_feeds(sender, instance, **kwargs):
+    # Название группы видно и на страницах её постов.
+    posts = Post.objects.filter(group=instance).values_list('pk', 'author_id')
+    names = ['index', f'group:{instance.pk}']
+    for post_id, author_id in posts:
+        names += [f'profile:{author_id}', f'post:{post_id}']
+    invalidate(*names)
+
+
+@receiver(post_save, sender=User)
+def user_invalidate_feeds(sender, instance, created, raw=False,
+                          update_fields=None, **kwargs):
+    # Имя автора видно в карточках всех его постов. У нового
+    # пользователя постов ещё нет, а вход меняет только last_login.
+    if created or raw or update_fields == frozenset({'last_login'}):
+        return
+    posts = Post.objects.filter(author=instance).values_list('pk', 'group_id')
+    names = ['index', f'profile:{instance.pk}']
+    for post_id, group_id in posts:
+        names += post_feeds(instance.pk, group_id, post_id)
+    invalidate(*names)
+
+
+@receiver(post_save, sender=Post)
+def post_fan_out(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_schedule_thumbnails(sender, instance, raw=False, **kwargs):
+    # Миниатюры, снятые с этой же картинки, уже готовы: правка текста
+    # не должна снова ставить генерацию в очередь.
+    if not raw and thumbnails.stored(instance) is None:
+        thumbnails.schedule(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_count_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump(UserStats, instance.author_id, follower_count=1)
+        bump(UserStats, instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_count_deleted(sender, instance, **kwargs):
+    bump(UserStats, instance.author_id, follower_count=-1)
+    bump(UserStats, instance.user_id, following_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_touch_profiles(sender, instance, raw=False, **kwargs):
+    # Счётчики подписок видны в карточках обоих профилей.
+    if not raw:
+        touch(f'profile:{instance.author_id}', f'profile:{instance.user_id}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_backfill(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def unfollow_remove(sender, instance, **kwargs):
+    timeline.remove(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=User)
+def user_index_prefixes(sender, instance, raw=False, update_fields=None,
+                        **kwargs):
+    # Вход в систему сохраняет только last_login: ключи не меняются.
+    if raw or update_fields == frozenset({'last_login'}):
+        return
+    autocomplete.index(PrefixEntry.USER, instance)
+
+
+@receiver(post_save, sender=Group)
+def group_index_prefixes(sender, instance, raw=False, **kwargs):
+    if not raw:
+        autocomplete.index(PrefixEntry.GROUP, instance)
+
+
+@receiver(post_delete, sender=User)
+def user_remove_prefixes(sender, instance, **kwargs):
+    autocomplete.remove(PrefixEntry.USER, instance.pk)
+
+
+@receiver(post_delete, sender=Group)
+def group_remove_prefixes(sender, instance, **kwargs):
+    autocomplete.remove(PrefixEntry.GROUP, instance.pk)
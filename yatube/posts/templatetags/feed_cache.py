@@ -0,0 +1,48 @@
+from django import template
+from django.conf import settings
+from django.core.cache.utils import make_template_fragment_key
+
+from ..cache import get_or_compute
+from ..holes import punching
+
+register = template.Library()
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        request = context.get('request')
+        if not punching(request):
+            # Части для зрителя нарисованы прямо во фрагменте: он свой
+            # у каждого пользователя.
+            user = getattr(request, 'user', None)
+            vary_on.append(f'user={getattr(user, "pk", None)}')
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        return get_or_compute(key, lambda: self.nodelist.render(context),
+                              settings.FEED_CACHE_TIMEOUT)
+
+
+@register.tag('feedcache')
+def do_feedcache(parser, token):
+    """
+    Кэширует фрагмент ленты на FEED_CACHE_TIMEOUT секунд.
+
+    Как {% cache %}, но через get_or_compute: когда фрагмент
+    устарел или пропал, его рендерит один запрос, а остальные
+    получают прежнюю версию или ждут результата.
+
+        {% feedcache index_page feed_key %} ... {% endfeedcache %}
+    """
+    nodelist = parser.parse(('endfeedcache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 2:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]!r} tag requires at least 1 argument.')
+    return FeedCacheNode(nodelist, tokens[1],
+                         [parser.compile_filter(var) for var in tokens[2:]])
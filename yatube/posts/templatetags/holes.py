@@ -0,0 +1,24 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from ..holes import punch, punching, render
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, *args):
+    """
+    Место для части страницы, зависящей от зрителя.
+
+    Тело страницы с такими метками одно для всех и кэшируется целиком,
+    а posts.middleware подставляет на их место части, отрисованные
+    для текущего пользователя (см. posts.holes). Вне кэша страниц
+    часть рисуется сразу.
+
+        {% hole "edit_link" post.author_id post.author.username post.id %}
+    """
+    request = context.get('request')
+    if punching(request):
+        return mark_safe(punch(name, *args))
+    return render(request, name, *args)
@@ -0,0 +1,21 @@
+from django import template
+
+register = template.Library()
+
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+@register.simple_tag(takes_context=True)
+def page_query(context, **params):
+    """
+    Строка запроса ссылки на другую страницу той же выдачи.
+
+    Остальные параметры текущего запроса (фильтры, поисковая строка)
+    сохраняются, прежние page, after и before заменяются переданными.
+    """
+    query = context['request'].GET.copy()
+    for name in PAGE_PARAMS:
+        query.pop(name, None)
+    for name, value in params.items():
+        query[name] = value
+    return '?' + query.urlencode()
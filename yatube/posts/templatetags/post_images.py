@@ -0,0 +1,39 @@
+from django import template
+from django.conf import settings
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+def srcset(thumbnails_by_width):
+    return ', '.join(f'{thumbnail.url} {width}w'
+                     for width, thumbnail in thumbnails_by_width)
+
+
+@register.inclusion_tag('includes/responsive_image.html')
+def responsive_image(post, preset):
+    """
+    <picture> с вариантами картинки поста по ширине и формату.
+
+    Пока основная миниатюра не создана, выводится заглушка с LQIP,
+    а генерация ставится в очередь.
+    """
+    context = {'lqip': post.image_lqip, 'fallback': None}
+    if not post.image:
+        return context
+    fallback, ready = thumbnails.resolve(post, preset)
+    if fallback is None:
+        thumbnails.schedule(post)
+        return context
+    *alternatives, default_format = settings.THUMBNAIL_FORMATS
+    context.update({
+        'fallback': fallback,
+        'srcset': srcset(ready.get(default_format, [])),
+        'sources': [
+            {'type': thumbnails.MIME_TYPES[fmt], 'srcset': srcset(ready[fmt])}
+            for fmt in alternatives if fmt in ready
+        ],
+        'sizes': settings.THUMBNAIL_SIZES,
+    })
+    return context
@@ -0,0 +1,69 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from posts import cache as coalescing
+
+
+class GetOrComputeTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value='свежее', delay=0):
+        def compute():
+            self.calls += 1
+            time.sleep(delay)
+            return value
+        return compute
+
+    def test_value_is_computed_once(self):
+        for _ in range(3):
+            self.assertEqual(
+                coalescing.get_or_compute('key', self.compute(), 60),
+                'свежее')
+        self.assertEqual(self.calls, 1)
+
+    def test_concurrent_misses_compute_once(self):
+        results = []
+
+        def request():
+            results.append(coalescing.get_or_compute(
+                'key', self.compute(delay=0.3), 60))
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['свежее'] * 8)
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_is_served_while_another_worker_refreshes(self):
+        coalescing.get_or_compute('key', self.compute('старое', 0.01), 1)
+        self.assertTrue(coalescing.acquire('key'))
+        with mock.patch('posts.cache.random.random', return_value=1e-300):
+            value = coalescing.get_or_compute('key', self.compute(), 1)
+        self.assertEqual(value, 'старое')
+        self.assertEqual(self.calls, 1)
+
+    def test_value_is_refreshed_early(self):
+        # Пересчёт занял 10 мс: при таком «невезучем» random до срока
+        # в секунду уже слишком близко.
+        coalescing.get_or_compute('key', self.compute('старое', 0.01), 1)
+        with mock.patch('posts.cache.random.random', return_value=1e-300):
+            value = coalescing.get_or_compute('key', self.compute(), 1)
+        self.assertEqual(value, 'свежее')
+        self.assertEqual(coalescing.get_or_compute('key', self.compute(), 60),
+                         'свежее')
+        self.assertEqual(self.calls, 2)
+
+    def test_waiter_computes_itself_when_owner_is_stuck(self):
+        self.assertTrue(coalescing.acquire('key'))
+        with mock.patch.object(coalescing, 'WAIT_TIMEOUT', 0.1):
+            value = coalescing.get_or_compute('key', self.compute(), 60)
+        self.assertEqual(value, 'свежее')
+        self.assertEqual(self.calls, 1)
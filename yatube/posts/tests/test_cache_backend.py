@@ -0,0 +1,68 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from yatube.cache_backends import SQLiteCache
+
+
+def bump(path, times):
+    cache = SQLiteCache(path, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_values_are_shared_between_instances(self):
+        self.cache.set('feed', {'posts': [1, 2]})
+        self.cache.set_many({'a': 1, 'b': 'два'})
+        other = self.make_cache()
+        self.assertEqual(other.get('feed'), {'posts': [1, 2]})
+        self.assertEqual(other.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': 'два'})
+        other.delete('a')
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_expired_values_are_gone(self):
+        self.cache.set('short', 1, timeout=0.05)
+        self.assertTrue(self.cache.add('persistent', 1, timeout=None))
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertTrue(self.cache.add('short', 2))
+        self.assertFalse(self.cache.add('persistent', 2))
+        self.assertEqual(self.cache.get('persistent'), 1)
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set('counter', 0, timeout=None)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=bump, args=(self.path, 50))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_least_recently_read_entries_are_evicted(self):
+        cache = self.make_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2,
+                                CULL_EVERY=1, LRU_RESOLUTION=0)
+        for i in range(10):
+            cache.set(f'key{i}', i)
+        cache.get('key0')
+        cache.set('key10', 10)
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(cache.get('key10'), 10)
@@ -0,0 +1,209 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from posts import timeline
+from posts.cache import feed_versions
+from posts.models import (Comment, Follow, Group, Post, PrefixEntry,
+                          TimelineEntry, User, UserStats)
+
+
+class GenerateDatasetTests(TestCase):
+    options = {'users': 40, 'groups': 3, 'posts': 300, 'comments': 500,
+               'follows': 5, 'batch_size': 64, 'stdout': StringIO()}
+
+    def snapshot(self):
+        return (
+            list(User.objects.order_by('pk')
+                 .values_list('username', 'stats__post_count')),
+            list(Post.objects.order_by('pk')
+                 .values_list('text', 'author__username', 'pub_date')),
+            list(Follow.objects.order_by('pk')
+                 .values_list('user__username', 'author__username')),
+        )
+
+    def test_dataset_is_consistent(self):
+        call_command('generate_dataset', seed=7, **self.options)
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 500)
+        top = User.objects.order_by('-stats__post_count').first()
+        self.assertGreater(top.stats.post_count, 300 / 40 * 3)
+        self.assertEqual(top.stats.post_count, top.user_posts.count())
+        follow = Follow.objects.first()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=follow.user, post__author=follow.author).exists())
+        self.assertTrue(PrefixEntry.objects.filter(
+            kind=PrefixEntry.USER, key='gen_0').exists())
+
+    def test_existing_rows_are_left_alone(self):
+        reader = User.objects.create_user(username='reader')
+        author = User.objects.create_user(username='author')
+        Follow.objects.create(user=reader, author=author)
+        Post.objects.create(text='Пост', author=author)
+        entry = TimelineEntry.objects.get(user=reader)
+        UserStats.objects.filter(user=author).update(post_count=5)
+        call_command('generate_dataset', seed=7, **self.options)
+        self.assertTrue(TimelineEntry.objects.filter(pk=entry.pk).exists())
+        self.assertEqual(UserStats.objects.get(user=author).post_count, 5)
+
+    def test_existing_prefixes_are_left_alone(self):
+        user = User.objects.create_user(username='reader')
+        PrefixEntry.objects.filter(object_id=user.pk).update(label='Читатель')
+        call_command('generate_dataset', seed=7, **self.options)
+        self.assertEqual(
+            set(PrefixEntry.objects.filter(kind=PrefixEntry.USER,
+                                           object_id=user.pk)
+                .values_list('label', flat=True)), {'Читатель'})
+        self.assertEqual(
+            PrefixEntry.objects.filter(kind=PrefixEntry.GROUP)
+            .values('object_id').distinct().count(), 3)
+
+    def test_invalid_options_are_rejected(self):
+        invalid = ({'users': 0}, {'posts': 0}, {'groups': -1},
+                   {'batch_size': 0})
+        for options in invalid:
+            with self.subTest(options=options), \
+                    self.assertRaises(CommandError):
+                call_command('generate_dataset',
+                             **{**self.options, **options})
+        self.assertFalse(User.objects.exists())
+
+    def test_partial_rebuild_matches_full_rebuild(self):
+        call_command('generate_dataset', seed=7, **self.options)
+        users = User.objects.values_list('pk', flat=True)
+        TimelineEntry.objects.all().delete()
+        timeline.rebuild_users(users)
+        partial = set(TimelineEntry.objects.values_list('user', 'post'))
+        timeline.rebuild_all()
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list('user', 'post')), partial)
+
+    def test_same_seed_gives_same_dataset(self):
+        call_command('generate_dataset', seed=7, **self.options)
+        first = self.snapshot()
+        for model in (Post, Group, User):
+            model.objects.all().delete()
+        call_command('generate_dataset', seed=7, **self.options)
+        self.assertEqual(self.snapshot(), first)
+
+
+class ExportUserTests(TestCase):
+    def test_export_to_file(self):
+        author = User.objects.create_user(username='writer')
+        post = Post.objects.create(text='Пост', author=author)
+        Comment.objects.create(post=post, author=author, text='Ого')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'writer.ndjson')
+            call_command('export_user', 'writer', output=path,
+                         stderr=StringIO())
+            with open(path, encoding='utf-8') as file:
+                rows = [json.loads(line) for line in file]
+        self.assertEqual([row['type'] for row in rows], ['post', 'comment'])
+
+    def test_unknown_user(self):
+        with self.assertRaises(CommandError):
+            call_command('export_user', 'nobody', stdout=StringIO())
+
+
+class ImportContentTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='writer')
+        self.reader = User.objects.create_user(username='reader')
+        Group.objects.create(title='Море', slug='sea')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'content.ndjson')
+
+    def write(self, records, mode='w'):
+        with open(self.path, mode, encoding='utf-8') as file:
+            for record in records:
+                line = record if isinstance(record, str) else json.dumps(
+                    record, ensure_ascii=False)
+                file.write(line + '\n')
+
+    def run_import(self, **options):
+        stderr = StringIO()
+        call_command('import_content', self.path, batch_size=2,
+                     stdout=StringIO(), stderr=stderr, **options)
+        return stderr.getvalue()
+
+    def test_import_skips_invalid_rows(self):
+        self.write([
+            {'type': 'post', 'id': 10, 'author': 'writer', 'text': 'Пост',
+             'pub_date': '2020-01-02T03:04:05', 'group': 'sea'},
+            {'type': 'comment', 'id': 5, 'post': 10, 'author': 'reader',
+             'text': 'Ого', 'created': '2020-01-03T00:00:00+00:00'},
+            {'type': 'follow', 'user': 'reader', 'author': 'writer'},
+            'не json',
+            {'type': 'post', 'id': 11, 'author': 'nobody', 'text': 'Пост',
+             'pub_date': '2020-01-02T03:04:05'},
+            {'type': 'comment', 'id': 6, 'post': 99, 'author': 'reader',
+             'text': 'Куда?', 'created': '2020-01-03T00:00:00'},
+            {'type': 'follow', 'user': 'reader', 'author': 'reader'},
+        ])
+        errors = self.run_import()
+        self.assertIn('Строка 4', errors)
+        self.assertIn("нет пользователя 'nobody'", errors)
+        self.assertIn('нет поста 99', errors)
+        post = Post.objects.get(pk=10)
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.group.slug, 'sea')
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(Comment.objects.get(pk=5).created.day, 3)
+        self.assertEqual(User.objects.get(username='writer')
+                         .stats.post_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+
+    def test_resume_from_checkpoint(self):
+        posts = [{'type': 'post', 'id': i, 'author': 'writer',
+                  'text': f'Пост {i}', 'pub_date': '2020-01-01T00:00:00'}
+                 for i in range(1, 6)]
+        self.write(posts[:3])
+        self.run_import()
+        with open(f'{self.path}.checkpoint') as file:
+            self.assertEqual(json.load(file)['line'], 3)
+        # Новые строки в конце файла: читаются только они.
+        Post.objects.filter(pk=1).delete()
+        self.write(posts[3:], mode='a')
+        self.run_import()
+        self.assertEqual(sorted(Post.objects.values_list('pk', flat=True)),
+                         [2, 3, 4, 5])
+        # Повтор с начала не создаёт дублей.
+        self.run_import(restart=True)
+        self.assertEqual(Post.objects.count(), 5)
+
+    def test_only_touched_rows_are_rebuilt(self):
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=other, author=self.reader)
+        Post.objects.create(text='Чужой пост', author=self.reader)
+        entry = TimelineEntry.objects.get(user=other)
+        UserStats.objects.filter(user=self.reader).update(post_count=5)
+        untouched = f'profile:{other.pk}'
+        touched = f'profile:{self.author.pk}'
+        versions = feed_versions(untouched, touched)
+        self.write([
+            {'type': 'follow', 'user': 'reader', 'author': 'writer'},
+            {'type': 'post', 'id': 10, 'author': 'writer', 'text': 'Пост',
+             'pub_date': '2020-01-02T03:04:05'},
+        ])
+        self.run_import()
+        self.assertTrue(TimelineEntry.objects.filter(pk=entry.pk).exists())
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post_id=10).exists())
+        # Подписка меняет профиль читателя: его счётчики пересчитаны.
+        self.assertEqual(UserStats.objects.get(user=self.reader).post_count,
+                         1)
+        self.assertEqual(UserStats.objects.get(user=self.author).post_count,
+                         1)
+        # Кэш сброшен только у затронутых лент.
+        after = feed_versions(untouched, touched)
+        self.assertEqual(after[untouched], versions[untouched])
+        self.assertNotEqual(after[touched], versions[touched])
+        self.assertFalse(os.path.exists(f'{self.path}.checkpoint.touched'))
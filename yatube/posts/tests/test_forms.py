@@ -1,12 +1,15 @@
 import shutil
 import tempfile
+from io import BytesIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
+from posts.forms import PostForm
 from posts.models import Group, Post
 
 User = get_user_model()
@@ -16,7 +19,9 @@ class FormPostTests(TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
-        settings.MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        cls.media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        cls.media = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media.enable()
 
         cls.group = Group.objects.create(
             title='Тестовая группа',
@@ -31,8 +36,11 @@ class FormPostTests(TestCase):
         self.authorized_client = Client()
         self.authorized_client.force_login(FormPostTests.user)
 
-    def tearDown(self):
-        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+    @classmethod
+    def tearDownClass(cls):
+        cls.media.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
 
     def test_create_new_post(self):
         post_count = Post.objects.count()
@@ -91,3 +99,76 @@ class FormPostTests(TestCase):
             response,
             reverse('login') + '?next=' + reverse('new_post')
         )
+
+
+class ImageUploadTests(TestCase):
+    def make_upload(self, size, fmt='JPEG', mode='RGB', exif=None,
+                    name='photo.jpg'):
+        buffer = BytesIO()
+        image = Image.new(mode, size, (10, 120, 200, 128)[:len(mode)])
+        params = {'exif': exif} if exif is not None else {}
+        image.save(buffer, fmt, **params)
+        return SimpleUploadedFile(name, buffer.getvalue(),
+                                  content_type=Image.MIME[fmt])
+
+    def clean(self, upload):
+        form = PostForm({'text': 'Пост с картинкой'}, {'image': upload})
+        return form, form.is_valid()
+
+    def test_exif_orientation_is_applied_and_metadata_stripped(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010f] = 'Camera'
+        form, valid = self.clean(self.make_upload((40, 20), exif=exif))
+        self.assertTrue(valid, form.errors)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.size, (20, 40))
+            self.assertEqual(len(image.getexif()), 0)
+
+    @override_settings(IMAGE_MAX_SIDE=32)
+    def test_large_image_is_downscaled(self):
+        form, valid = self.clean(self.make_upload((64, 48)))
+        self.assertTrue(valid, form.errors)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.size, (32, 24))
+
+    def test_transparency_is_kept_as_png(self):
+        form, valid = self.clean(self.make_upload(
+            (8, 8), fmt='PNG', mode='RGBA', name='icon.png'))
+        self.assertTrue(valid, form.errors)
+        self.assertEqual(form.cleaned_data['image'].name, 'icon.png')
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.mode, 'RGBA')
+
+    @override_settings(IMAGE_MAX_PIXELS=100)
+    def test_too_many_pixels_are_rejected_before_decoding(self):
+        form, valid = self.clean(self.make_upload((20, 20), fmt='PNG',
+                                                  name='bomb.png'))
+        self.assertFalse(valid)
+        self.assertIn('image', form.errors)
+
+    @override_settings(IMAGE_MAX_PIXELS=1000, IMAGE_MAX_DECODED_PIXELS=100)
+    def test_only_jpeg_may_exceed_the_decoded_cap(self):
+        form, valid = self.clean(self.make_upload((20, 20)))
+        self.assertTrue(valid, form.errors)
+        form, valid = self.clean(self.make_upload((20, 20), fmt='PNG',
+                                                  name='big.png'))
+        self.assertFalse(valid)
+        self.assertIn('image', form.errors)
+
+    def test_truncated_jpeg_is_rejected(self):
+        upload = self.make_upload((200, 200))
+        content = upload.read()
+        truncated = SimpleUploadedFile(
+            'broken.jpg', content[:len(content) // 2],
+            content_type='image/jpeg')
+        form, valid = self.clean(truncated)
+        self.assertFalse(valid)
+        self.assertEqual(form.errors.as_data()['image'][0].code,
+                         'invalid_image')
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=10)
+    def test_oversized_file_is_rejected(self):
+        form, valid = self.clean(self.make_upload((20, 20)))
+        self.assertFalse(valid)
+        self.assertIn('image', form.errors)
@@ -0,0 +1,80 @@
+import json
+import random
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import models
+from django.test import LiveServerTestCase, override_settings
+
+from posts.management.commands import loadtest
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class LoadTestCommandTests(LiveServerTestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'user{i}')
+                      for i in range(3)]
+        Group.objects.create(title='Тестовая группа', slug='test-slug')
+        Post.objects.create(text='Тестовый пост', author=self.users[0])
+
+    def test_report_covers_every_action(self):
+        out = StringIO()
+        with tempfile.NamedTemporaryFile(suffix='.json') as report_file:
+            call_command('loadtest', url=self.live_server_url,
+                         requests=60, concurrency=1, seed=1,
+                         mix='feed=1,post=1,comment=1,follow=1',
+                         output=report_file.name, stdout=out)
+            report = json.load(report_file)
+        self.assertEqual(report['requests'], 60)
+        for name in ('post', 'add_comment'):
+            with self.subTest(name=name):
+                self.assertIn(name, report['urls'])
+                self.assertEqual(report['urls'][name]['errors'], 0)
+                self.assertIn('p99_ms', report['urls'][name])
+        self.assertTrue(Comment.objects.exists())
+        self.assertIn('RPS', out.getvalue())
+
+    def test_follow_actions_do_not_fail(self):
+        Follow.objects.create(user=self.users[0], author=self.users[1])
+        with tempfile.NamedTemporaryFile(suffix='.json') as report_file:
+            call_command('loadtest', url=self.live_server_url,
+                         requests=60, concurrency=1, seed=2, mix='follow=1',
+                         output=report_file.name, stdout=StringIO())
+            report = json.load(report_file)
+        for name in ('profile_follow', 'profile_unfollow'):
+            with self.subTest(name=name):
+                self.assertGreater(report['urls'][name]['requests'], 0)
+                self.assertEqual(report['urls'][name]['errors'], 0)
+        self.assertFalse(Follow.objects.filter(
+            user=models.F('author')).exists())
+
+    def test_upload_creates_post_with_image(self):
+        media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with tempfile.NamedTemporaryFile(suffix='.json') as report_file, \
+                override_settings(MEDIA_ROOT=media_root,
+                                  THUMBNAIL_WORKERS=0):
+            call_command('loadtest', url=self.live_server_url,
+                         requests=3, concurrency=1, seed=1, mix='upload=1',
+                         output=report_file.name, stdout=StringIO())
+            report = json.load(report_file)
+        self.assertEqual(report['urls']['new_post']['requests'], 3)
+        self.assertEqual(report['urls']['new_post']['errors'], 0)
+        self.assertEqual(Post.objects.exclude(image='').count(), 3)
+
+    def test_same_seed_picks_same_users(self):
+        User.objects.bulk_create(User(username=f'extra{i}')
+                                 for i in range(20))
+        picked = []
+        for _ in range(2):
+            command = loadtest.Command()
+            command.random = random.Random(3)
+            command.load_targets(5)
+            picked.append(command.usernames)
+        self.assertEqual(picked[0], picked[1])
@@ -1,7 +1,21 @@
+from importlib import import_module
+from io import StringIO
+from unittest import mock, skipUnless
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
 
-from posts.models import Group, Post
+from posts import counters
+from posts.counters import bump
+from posts.models import Comment, Follow, Group, Post, UserStats
+from posts.paginators import CursorPaginator
 
 User = get_user_model()
 
@@ -78,3 +92,252 @@ class GroupModelTest(TestCase):
             with self.subTest(value=value):
                 self.assertEqual(
                     group._meta.get_field(value).help_text, expected)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='mr.test')
+        cls.reader = User.objects.create(username='mrs.test')
+        cls.group = Group.objects.create(title='Тестовая группа',
+                                         slug='test-slug')
+        cls.group_2 = Group.objects.create(title='Другая группа',
+                                           slug='test-slug-2')
+
+    def refresh(self, *objects):
+        for obj in objects:
+            obj.refresh_from_db()
+
+    def test_counters_follow_writes(self):
+        post = Post.objects.create(text='Пост', author=self.user,
+                                   group=self.group)
+        comment = Comment.objects.create(post=post, author=self.reader,
+                                         text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        self.refresh(post, self.group, self.user.stats, self.reader.stats)
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.group.post_count, 1)
+        self.assertEqual(self.user.stats.post_count, 1)
+        self.assertEqual(self.user.stats.follower_count, 1)
+        self.assertEqual(self.reader.stats.following_count, 1)
+
+        post.group = self.group_2
+        post.save()
+        self.refresh(self.group, self.group_2)
+        self.assertEqual(self.group.post_count, 0)
+        self.assertEqual(self.group_2.post_count, 1)
+
+        comment.delete()
+        follow.delete()
+        post.delete()
+        self.refresh(self.group_2, self.user.stats, self.reader.stats)
+        self.assertEqual(self.group_2.post_count, 0)
+        self.assertEqual(self.user.stats.post_count, 0)
+        self.assertEqual(self.user.stats.follower_count, 0)
+        self.assertEqual(self.reader.stats.following_count, 0)
+
+    def test_repair_counters_command(self):
+        post = Post.objects.create(text='Пост', author=self.user,
+                                   group=self.group)
+        Post.objects.filter(pk=post.pk).update(comment_count=7)
+        Group.objects.filter(pk=self.group.pk).update(post_count=0)
+        UserStats.objects.filter(user=self.reader).delete()
+
+        out = StringIO()
+        call_command('repair_counters', '--dry-run', stdout=out)
+        self.assertIn('Post: расхождений 1', out.getvalue())
+        self.refresh(post)
+        self.assertEqual(post.comment_count, 7)
+
+        call_command('repair_counters', stdout=StringIO())
+        self.refresh(post, self.group)
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(self.group.post_count, 1)
+        self.assertTrue(UserStats.objects.filter(user=self.reader).exists())
+
+    def test_post_edit_moves_group_counter_atomically(self):
+        post = Post.objects.create(text='Пост', author=self.user,
+                                   group=self.group)
+        self.client.force_login(self.user)
+        calls = []
+
+        def fail_second(model, pk, **deltas):
+            calls.append(pk)
+            if len(calls) == 2:
+                raise RuntimeError('сбой между двумя UPDATE')
+            bump(model, pk, **deltas)
+
+        with mock.patch('posts.signals.bump', fail_second):
+            with self.assertRaises(RuntimeError):
+                self.client.post(
+                    reverse('post_edit', args=[self.user.username, post.pk]),
+                    {'text': 'Пост', 'group': self.group_2.pk})
+        self.refresh(self.group, self.group_2)
+        self.assertEqual(self.group.post_count, 1)
+        self.assertEqual(self.group_2.post_count, 0)
+
+    def test_post_delete_does_not_touch_each_comment(self):
+        queries = []
+        for comments in (1, 10):
+            post = Post.objects.create(text='Пост', author=self.user,
+                                       group=self.group)
+            for _ in range(comments):
+                Comment.objects.create(post=post, author=self.reader,
+                                       text='Комментарий')
+            with CaptureQueriesContext(connection) as captured, \
+                    mock.patch('posts.signals.invalidate') as invalidate:
+                post.delete()
+            queries.append(len(captured))
+            invalidate.assert_called_once()
+        self.assertEqual(queries[0], queries[1])
+        # Отдельный комментарий по-прежнему сдвигает счётчик поста.
+        post = Post.objects.create(text='Пост', author=self.user)
+        Comment.objects.create(post=post, author=self.reader, text='Ого')
+        Comment.objects.get(post=post).delete()
+        self.refresh(post)
+        self.assertEqual(post.comment_count, 0)
+
+    def test_missing_stats_are_recounted_once(self):
+        Post.objects.create(text='Пост', author=self.user)
+        UserStats.objects.filter(user=self.user).delete()
+        cache.clear()
+        # Два воркера загрузили автора, пока строки счётчиков не было.
+        first, second = (User.objects.select_related('stats')
+                         .get(pk=self.user.pk) for _ in range(2))
+        self.assertEqual(counters.user_stats(first).post_count, 1)
+        with mock.patch('posts.counters.recount') as recount:
+            self.assertEqual(counters.user_stats(second).post_count, 1)
+        recount.assert_not_called()
+
+    def test_pages_recreate_missing_stats(self):
+        post = Post.objects.create(text='Пост', author=self.user)
+        Follow.objects.create(user=self.reader, author=self.user)
+        # Как после loaddata: сигнал не создал строку счётчиков.
+        UserStats.objects.filter(user=self.user).delete()
+        cache.clear()
+        response = self.client.get(reverse('post',
+                                           args=[self.user.username, post.pk]))
+        self.assertEqual(response.context['post_count'], 1)
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.post_count, stats.follower_count), (1, 1))
+        UserStats.objects.filter(user=self.user).delete()
+        cache.clear()
+        response = self.client.get(reverse('profile',
+                                           args=[self.user.username]))
+        self.assertContains(response, 'Подписчиков: 1')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'План запроса снят для SQLite')
+class QueryPlanTest(TestCase):
+    """Сортировки лент должны идти по индексу, без временного B-дерева."""
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    def test_feed_queries_use_indexes(self):
+        cursor = [timezone.now(), 100]
+        queries = {
+            'index': Post.objects.for_feed(),
+            'profile': Post.objects.filter(author_id=1),
+            'group': Post.objects.filter(group_id=1),
+        }
+        for name, queryset in queries.items():
+            paginator = CursorPaginator(queryset, 10)
+            for values in (None, cursor):
+                with self.subTest(feed=name, cursor=values):
+                    plan = self.plan(paginator.slice(values)[:11])
+                    self.assertNotIn('TEMP B-TREE', plan)
+                    self.assertIn('USING INDEX post_', plan)
+
+    def test_comments_and_follow_use_indexes(self):
+        plan = self.plan(Comment.objects.filter(post_id=1)
+                         .order_by('created', 'id'))
+        self.assertIn('comment_post_created', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        plan = self.plan(Follow.objects.filter(user_id=1, author_id=2))
+        self.assertIn('user_id=? AND author_id=?', plan)
+
+
+class MigrationTest(TransactionTestCase):
+    before = [('posts', '0007_counters')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_duplicates_are_dropped_and_counters_recounted(self):
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes('posts')
+        apps = self.migrate(self.before)
+        try:
+            OldUser = apps.get_model('auth', 'User')
+            OldFollow = apps.get_model('posts', 'Follow')
+            OldUserStats = apps.get_model('posts', 'UserStats')
+            reader = OldUser.objects.create(username='reader')
+            author = OldUser.objects.create(username='author')
+            for user in (reader, author):
+                OldUserStats.objects.create(user_id=user.pk)
+            for _ in range(3):
+                OldFollow.objects.create(user_id=reader.pk,
+                                         author_id=author.pk)
+            OldUserStats.objects.filter(pk=reader.pk).update(
+                following_count=3)
+            OldUserStats.objects.filter(pk=author.pk).update(
+                follower_count=3)
+        finally:
+            self.migrate(latest)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(UserStats.objects.get(pk=reader.pk).following_count,
+                         1)
+        self.assertEqual(UserStats.objects.get(pk=author.pk).follower_count,
+                         1)
+
+    def test_timelines_are_filled_with_frozen_limits(self):
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes('posts')
+        fill = import_module('posts.migrations.0006_timelineentry')
+        apps = self.migrate([('posts', '0005_follow')])
+        try:
+            OldUser = apps.get_model('auth', 'User')
+            OldPost = apps.get_model('posts', 'Post')
+            OldFollow = apps.get_model('posts', 'Follow')
+            reader, other, author, star = (
+                OldUser.objects.create(username=name)
+                for name in ('reader', 'other', 'author', 'star'))
+            posts = [OldPost.objects.create(text=f'Пост {i}', author=author)
+                     for i in range(3)]
+            OldPost.objects.create(text='Пост звезды', author=star)
+            for user, followed in ((reader, author), (reader, author),
+                                   (reader, star), (other, star)):
+                OldFollow.objects.create(user=user, author=followed)
+            with mock.patch.multiple(fill, TIMELINE_LENGTH=2,
+                                     TIMELINE_FANOUT_LIMIT=1), \
+                    self.settings(TIMELINE_LENGTH=100):
+                apps = self.migrate([('posts', '0006_timelineentry')])
+            entries = set(apps.get_model('posts', 'TimelineEntry').objects
+                          .values_list('user_id', 'post_id'))
+        finally:
+            self.migrate(latest)
+        self.assertEqual(entries, {(reader.pk, posts[2].pk),
+                                   (reader.pk, posts[1].pk)})
+
+    def fts_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                "AND name LIKE 'posts_post_fts_%'")
+            return {name for name, in cursor.fetchall()}
+
+    def test_rollback_keeps_search_triggers(self):
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes('posts')
+        try:
+            for target in ('0011_post_image_lqip', '0010_autocomplete'):
+                with self.subTest(target=target):
+                    self.migrate([('posts', target)])
+                    self.assertEqual(len(self.fts_triggers()), 3)
+        finally:
+            self.migrate(latest)
+        self.assertEqual(len(self.fts_triggers()), 3)
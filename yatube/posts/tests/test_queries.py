@@ -0,0 +1,169 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from about import urls as about_urls
+from api import urls as api_urls
+from posts import urls as posts_urls
+from posts.models import Comment, Follow, Group, Post
+from users import urls as users_urls
+
+User = get_user_model()
+
+URL_MODULES = (
+    (posts_urls, ''),
+    (users_urls, ''),
+    (about_urls, 'about:'),
+    (api_urls, 'api:'),
+)
+
+# Допустимое число SQL-запросов: (аноним, авторизованный пользователь).
+# Бюджет считается на холодном кэше, то есть это худший случай. В лентах
+# один запрос уходит на пакетный поиск миниатюр всей страницы.
+QUERY_BUDGETS = {
+    'index': (2, 4),
+    'index_rss': (1, 3),
+    'index_atom': (1, 3),
+    'slug_rss': (2, 4),
+    'slug_atom': (2, 4),
+    'profile_rss': (2, 4),
+    'profile_atom': (2, 4),
+    'follow_index': (0, 6),
+    'profile_follow': (0, 6),
+    'profile_unfollow': (0, 11),
+    'export': (0, 5),
+    'new_post': (0, 5),
+    'post_edit': (0, 6),
+    'post': (3, 5),
+    'profile': (3, 6),
+    'slug': (3, 5),
+    'add_comment': (0, 5),
+    'search': (3, 5),
+    'autocomplete': (2, 2),
+    'signup': (0, 2),
+    'about:author': (0, 2),
+    'about:tech': (0, 2),
+    'api:posts': (1, 3),
+    'api:post': (1, 3),
+    'api:comments': (2, 4),
+    'api:groups': (1, 3),
+    'api:group': (1, 3),
+    'api:profile': (1, 3),
+    'api:follow': (0, 4),
+}
+
+# Эти страницы — ленты: число запросов не должно зависеть от размера
+# страницы. Для каждой указана настройка, которая этот размер задаёт.
+PAGINATED = {
+    'index': 'POSTS_PER_PAGE',
+    'post': 'COMMENTS_PER_PAGE',
+    'follow_index': 'POSTS_PER_PAGE',
+    'profile': 'POSTS_PER_PAGE',
+    'slug': 'POSTS_PER_PAGE',
+    'search': 'POSTS_PER_PAGE',
+    'api:posts': 'API_PAGE_SIZE',
+    'api:comments': 'API_PAGE_SIZE',
+    'api:follow': 'API_PAGE_SIZE',
+}
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rnd = random.Random(42)
+        cls.users = [User.objects.create_user(username=f'user{i}')
+                     for i in range(20)]
+        cls.user = cls.users[0]
+        cls.groups = [Group.objects.create(title=f'Группа {i}',
+                                           slug=f'group-{i}')
+                      for i in range(4)]
+        for author in cls.users[1:]:
+            Follow.objects.create(user=cls.user, author=author)
+        for i in range(60):
+            # У каждого второго поста картинка: миниатюры ленты должны
+            # находиться одним пакетом, а не запросом на пост.
+            post = Post.objects.create(text=f'Пост {i}',
+                                       author=rnd.choice(cls.users),
+                                       group=rnd.choice(cls.groups + [None]),
+                                       image=f'posts/{i}.jpg' if i % 2 else '')
+            for _ in range(rnd.randint(0, 4)):
+                Comment.objects.create(post=post,
+                                       author=rnd.choice(cls.users),
+                                       text='Комментарий')
+        cls.post = Post.objects.create(text='Пост автора', author=cls.user,
+                                       group=cls.groups[0])
+        # Комментариев больше, чем помещается на самую большую страницу
+        # в test_feed_queries_do_not_grow_with_page_size.
+        for i in range(25):
+            Comment.objects.create(post=cls.post, author=cls.users[i % 20],
+                                   text=f'Комментарий {i}')
+        cls.url_kwargs = {
+            'username': cls.user.username,
+            'post_id': cls.post.pk,
+            'slug': cls.groups[0].slug,
+            'fmt': 'ndjson',
+        }
+        cls.url_overrides = {
+            'profile_follow': {'username': cls.users[1].username},
+            'profile_unfollow': {'username': cls.users[2].username},
+        }
+        cls.url_queries = {'search': '?q=Пост', 'autocomplete': '?q=us'}
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(QueryBudgetTests.user)
+
+    def named_urls(self):
+        for module, namespace in URL_MODULES:
+            for pattern in module.urlpatterns:
+                name = namespace + pattern.name
+                kwargs = {key: self.url_kwargs[key]
+                          for key in pattern.pattern.converters}
+                kwargs.update(self.url_overrides.get(name, {}))
+                yield name, (reverse(name, kwargs=kwargs)
+                             + self.url_queries.get(name, ''))
+
+    def count_queries(self, client, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertIn(response.status_code, (200, 302, 401), url)
+        return len(queries)
+
+    def test_every_named_url_has_budget(self):
+        names = {name for name, _ in self.named_urls()}
+        self.assertEqual(names, set(QUERY_BUDGETS))
+
+    def test_views_stay_within_query_budget(self):
+        clients = (
+            ('аноним', self.guest_client),
+            ('пользователь', self.authorized_client),
+        )
+        for name, url in self.named_urls():
+            for index, (who, client) in enumerate(clients):
+                with self.subTest(url=name, client=who):
+                    budget = QUERY_BUDGETS[name][index]
+                    used = self.count_queries(client, url)
+                    self.assertLessEqual(
+                        used, budget,
+                        f'{name} ({who}): {used} запросов при бюджете '
+                        f'{budget}')
+
+    def test_feed_queries_do_not_grow_with_page_size(self):
+        for name, url in self.named_urls():
+            if name not in PAGINATED:
+                continue
+            setting = PAGINATED[name]
+            with self.subTest(url=name):
+                with override_settings(**{setting: 2}):
+                    small = self.count_queries(self.authorized_client, url)
+                with override_settings(**{setting: 20}):
+                    large = self.count_queries(self.authorized_client, url)
+                self.assertEqual(small, large)
@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import Client, TestCase
 from django.urls import reverse
 
@@ -24,6 +25,7 @@ class URLTests(TestCase):
         cls.post_edit_adress = f'/{cls.user.username}/{cls.post.id}/edit/'
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(URLTests.user)
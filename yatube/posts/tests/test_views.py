@@ -1,14 +1,27 @@
+import csv
+import json
 import shutil
 import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
+from django.contrib import admin
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.db import connection
+from django.template import Context, Template
+from django.template.loader import render_to_string
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
-from posts.models import Group, Post
+from posts import thumbnails, timeline
+from posts.admin import PostAdmin
+from posts.cache import post_feeds
+from posts.models import Comment, Follow, Group, Post, TimelineEntry
 
 User = get_user_model()
 
@@ -17,7 +30,9 @@ class ViewsTests(TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
-        settings.MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        cls.media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        cls.media = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media.enable()
 
         cls.small_gif = (
             b'\x47\x49\x46\x38\x39\x61\x02\x00'
@@ -47,6 +62,7 @@ class ViewsTests(TestCase):
                                        image=cls.uploaded)
 
     def setUp(self):
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(ViewsTests.user)
         self.auth_client = Client()
@@ -55,8 +71,9 @@ class ViewsTests(TestCase):
 
     @classmethod
     def tearDownClass(cls):
+        cls.media.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
         super().tearDownClass()
-        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
 
     def test_pages_use_correct_template(self):
         templates_pages_names = {
@@ -211,6 +228,7 @@ class PaginatorViewsTest(TestCase):
         Post.objects.bulk_create(objs)
 
     def setUp(self):
+        cache.clear()
         self.client = Client()
 
     def test_first_page_contains_ten_records(self):
@@ -239,3 +257,772 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(len(
                     responce.context.get('page').object_list),
                     expected)
+
+    def test_cursor_pages_cover_all_records(self):
+        pages = (
+            reverse('index'),
+            reverse('slug', kwargs={"slug": "test-slug"}),
+            reverse('profile', kwargs={'username': self.user.username}),
+        )
+        for value in pages:
+            with self.subTest(value=value):
+                first = self.client.get(value).context.get('page')
+                self.assertEqual(len(first.object_list), 10)
+                self.assertFalse(first.has_previous())
+                second = self.client.get(
+                    value, {'after': first.next_cursor}).context.get('page')
+                self.assertEqual(len(second.object_list), 3)
+                self.assertFalse(second.has_next())
+                self.assertFalse(
+                    set(first.object_list) & set(second.object_list))
+                back = self.client.get(
+                    value,
+                    {'before': second.previous_cursor}).context.get('page')
+                self.assertEqual(back.object_list, first.object_list)
+
+    def test_page_links_keep_other_params(self):
+        response = self.client.get(reverse('index'), {'utm_source': 'mail'})
+        page = response.context.get('page')
+        self.assertContains(
+            response, f'href="?utm_source=mail&amp;after={page.next_cursor}"')
+        response = self.client.get(reverse('index'),
+                                   {'utm_source': 'mail', 'page': 1})
+        self.assertContains(response, 'href="?utm_source=mail&amp;page=2"')
+
+    def test_cursor_paginator_totals_render_empty(self):
+        page = self.client.get(reverse('index')).context.get('page')
+        rendered = Template(
+            '[{{ page.paginator.count }}{{ page.paginator.num_pages }}'
+            '{% for i in page.paginator.page_range %}{{ i }}{% endfor %}]'
+        ).render(Context({'page': page}))
+        self.assertEqual(rendered, '[]')
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.client.get(reverse('index'), {'after': 'мусор'})
+        self.assertEqual(len(response.context.get('page').object_list), 10)
+
+
+@override_settings(COMMENTS_PER_PAGE=3)
+class CommentPagesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='writer')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+        cls.url = reverse('post', args=['writer', cls.post.pk])
+
+    def setUp(self):
+        cache.clear()
+
+    def comment(self, count):
+        for i in range(count):
+            reader = User.objects.create_user(
+                username=f'reader{Comment.objects.count()}')
+            Comment.objects.create(post=self.post, author=reader,
+                                   text=f'Комментарий {i}')
+
+    def test_pages_follow_cursor(self):
+        self.comment(7)
+        seen = []
+        response = self.client.get(self.url)
+        while True:
+            page = response.context['comments']
+            seen.extend(page)
+            if not page.has_next():
+                break
+            self.assertContains(response, f'?after={page.next_cursor}')
+            response = self.client.get(self.url,
+                                       {'after': page.next_cursor})
+        self.assertEqual(seen, list(Comment.objects.order_by('created',
+                                                             'id')))
+
+    def test_new_comment_lands_on_its_page(self):
+        self.comment(7)
+        self.client.force_login(self.author)
+        response = self.client.post(
+            reverse('add_comment', args=['writer', self.post.pk]),
+            {'text': 'Мой комментарий'}, follow=True)
+        comment = Comment.objects.get(text='Мой комментарий')
+        page = response.context['comments']
+        self.assertEqual(list(page)[-1], comment)
+        self.assertEqual(len(page), 3)
+        self.assertTrue(response.redirect_chain[0][0].endswith(
+            f'#comment_{comment.pk}'))
+        earlier = self.client.get(self.url,
+                                  {'before': page.previous_cursor})
+        self.assertEqual(list(earlier.context['comments']),
+                         list(Comment.objects.order_by('created', 'id'))[2:5])
+
+    def test_queries_do_not_grow_with_comments(self):
+        # Пост с автором и страница комментариев с их авторами.
+        for count in (1, 6):
+            self.comment(count)
+            cache.clear()
+            with self.subTest(count=count), self.assertNumQueries(2):
+                self.client.get(self.url)
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.star = User.objects.create_user(username='star')
+        cls.old_post = Post.objects.create(text='Старый пост',
+                                           author=cls.author)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(TimelineTests.reader)
+
+    def follow_page(self):
+        return self.client.get(reverse('follow_index')).context['page']
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        self.client.get(reverse('profile_follow',
+                                kwargs={'username': self.author.username}))
+        self.assertEqual(self.reader.timeline.count(), 1)
+        self.assertEqual(list(self.follow_page()), [self.old_post])
+        self.client.get(reverse('profile_unfollow',
+                                kwargs={'username': self.author.username}))
+        self.assertEqual(self.reader.timeline.count(), 0)
+        self.assertEqual(list(self.follow_page()), [])
+
+    def test_new_post_is_fanned_out(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(list(self.follow_page()), [post, self.old_post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_is_merged_at_read_time(self):
+        Follow.objects.create(user=self.reader, author=self.star)
+        post = Post.objects.create(text='Пост звезды', author=self.star)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertEqual(list(self.follow_page()), [post])
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_fan_out_keeps_timeline_length(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [Post.objects.create(text=f'Пост {i}', author=self.author)
+                 for i in range(3)]
+        self.assertEqual(list(self.follow_page()), posts[:0:-1])
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_trim_breaks_ties_by_post(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [Post.objects.create(text=f'Пост {i}', author=self.author)
+                 for i in range(2)]
+        # У всех записей одна дата: граница проходит по id поста.
+        TimelineEntry.objects.update(pub_date=self.old_post.pub_date)
+        TimelineEntry.objects.create(user=self.reader, post=self.old_post,
+                                     pub_date=self.old_post.pub_date)
+        timeline.trim(self.reader.pk)
+        self.assertEqual(
+            sorted(self.reader.timeline.values_list('post_id', flat=True)),
+            [post.pk for post in posts])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_star_below_limit_is_backfilled(self):
+        Follow.objects.create(user=self.reader, author=self.star)
+        Follow.objects.create(user=self.author, author=self.star)
+        post = Post.objects.create(text='Пост звезды', author=self.star)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        Follow.objects.filter(user=self.author).delete()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertEqual(list(self.follow_page()), [post])
+
+
+class FeedCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='mr.test')
+        cls.group = Group.objects.create(title='Тестовая группа',
+                                         slug='test-slug')
+        cls.posts = [Post.objects.create(text=f'Пост номер {i:02}',
+                                         author=cls.user, group=cls.group)
+                     for i in range(11)]
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_pages_are_cached_separately(self):
+        pages = (
+            reverse('index'),
+            reverse('slug', kwargs={'slug': self.group.slug}),
+            reverse('profile', kwargs={'username': self.user.username}),
+        )
+        for value in pages:
+            with self.subTest(value=value):
+                first = self.client.get(value)
+                self.assertNotContains(first, 'Пост номер 00')
+                second = self.client.get(value, {'page': 2})
+                self.assertContains(second, 'Пост номер 00')
+                self.assertNotContains(second, 'Пост номер 10')
+
+    def test_changes_invalidate_cached_feeds(self):
+        url = reverse('slug', kwargs={'slug': self.group.slug})
+        self.client.get(url)
+        post = self.posts[-1]
+        post.text = 'Исправленный пост'
+        post.save()
+        self.assertContains(self.client.get(url), 'Исправленный пост')
+        Comment.objects.create(post=post, author=self.user, text='Ого')
+        self.assertContains(self.client.get(url), 'Комментариев: 1')
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertContains(self.client.get(reverse('index')),
+                            '#Новое название')
+
+    def test_author_changes_invalidate_cached_feeds(self):
+        urls = (
+            reverse('index'),
+            reverse('slug', kwargs={'slug': self.group.slug}),
+        )
+        for url in urls:
+            self.client.get(url)
+        user = User.objects.get(pk=self.user.pk)
+        user.username = 'mr.renamed'
+        user.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), '@mr.renamed')
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='writer')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Море', slug='sea')
+        cls.post = Post.objects.create(text='Пост', author=cls.author,
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.urls = (
+            reverse('index'),
+            reverse('slug', kwargs={'slug': self.group.slug}),
+            reverse('profile', kwargs={'username': self.author.username}),
+            reverse('post', kwargs={'username': self.author.username,
+                                    'post_id': self.post.pk}),
+        )
+
+    def revalidate(self, client, url, response):
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_pages_are_not_rendered_again(self):
+        # Пользователю ответ стоит только сессии и самого пользователя,
+        # анониму — ни одного запроса.
+        self.client.force_login(self.reader)
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                with self.assertNumQueries(2):
+                    again = self.revalidate(self.client, url, response)
+                self.assertEqual(again.status_code, 304)
+        self.client.logout()
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                with self.assertNumQueries(0):
+                    again = self.revalidate(self.client, url, response)
+                self.assertEqual(again.status_code, 304)
+                again = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(again.status_code, 304)
+
+    def test_changes_produce_new_validators(self):
+        changes = (
+            lambda: Post.objects.create(text='Новый', author=self.author,
+                                        group=self.group),
+            lambda: Comment.objects.create(post=self.post, author=self.reader,
+                                           text='Ого'),
+        )
+        for change in changes:
+            responses = [self.client.get(url) for url in self.urls]
+            change()
+            for url, response in zip(self.urls, responses):
+                with self.subTest(url=url):
+                    self.assertEqual(
+                        self.revalidate(self.client, url, response)
+                        .status_code, 200)
+
+    def test_follow_changes_profile_validators(self):
+        url = reverse('profile', kwargs={'username': self.author.username})
+        response = self.client.get(url)
+        Follow.objects.create(user=self.reader, author=self.author)
+        again = self.revalidate(self.client, url, response)
+        self.assertContains(again, 'Подписчиков: 1')
+
+    def test_validators_depend_on_viewer(self):
+        url = self.urls[0]
+        response = self.client.get(url)
+        self.client.force_login(self.reader)
+        again = self.revalidate(self.client, url, response)
+        self.assertEqual(again.status_code, 200)
+        self.assertFalse(again.has_header('Last-Modified'))
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='writer')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Море', slug='sea')
+        cls.post = Post.objects.create(text='Пост', author=cls.author,
+                                       group=cls.group)
+        cls.other = Post.objects.create(text='Другой', author=cls.reader)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.post_url = reverse('post', kwargs={
+            'username': self.author.username, 'post_id': self.post.pk})
+        self.other_url = reverse('post', kwargs={
+            'username': self.reader.username, 'post_id': self.other.pk})
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        first = self.client.get(self.post_url)
+        self.assertEqual(first['Surrogate-Key'],
+                         f'post:{self.post.pk} profile:{self.author.pk}')
+        self.assertIn('public', first['Cache-Control'])
+        self.assertIn('s-maxage=0', first['Cache-Control'])
+        with self.assertNumQueries(0):
+            second = self.client.get(self.post_url)
+        self.assertEqual(second.content, first.content)
+
+    def test_signals_purge_dependent_pages_only(self):
+        self.client.get(self.post_url)
+        self.client.get(self.other_url)
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Ого')
+        self.assertContains(self.client.get(self.post_url), 'Ого')
+        with self.assertNumQueries(0):
+            self.client.get(self.other_url)
+        Follow.objects.create(user=self.author, author=self.reader)
+        self.assertContains(self.client.get(self.other_url),
+                            'Подписчиков: 1')
+
+    def test_viewers_share_cached_body(self):
+        profile_url = reverse('profile',
+                              kwargs={'username': self.author.username})
+        self.client.get(self.post_url)
+        self.client.get(profile_url)
+        author = Client()
+        author.force_login(self.author)
+        with self.assertNumQueries(2):
+            response = author.get(self.post_url)
+        self.assertContains(response, 'Редактировать')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, f'Пользователь: {self.author}')
+        self.assertNotContains(response, '<!--hole:')
+        reader = Client()
+        reader.force_login(self.reader)
+        response = reader.get(self.post_url)
+        self.assertNotContains(response, 'Редактировать')
+        with self.assertNumQueries(3):
+            response = reader.get(profile_url)
+        self.assertContains(response, 'Подписаться')
+
+    def test_logged_in_pages_are_private(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(self.post_url)
+        self.assertIn('private', response['Cache-Control'])
+        self.client.logout()
+        response = self.client.get(self.post_url)
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+
+    def test_holes_render_inline_outside_page_cache(self):
+        without_cache = [name for name in settings.MIDDLEWARE
+                         if not name.endswith('PageCacheMiddleware')]
+        self.client.force_login(self.author)
+        with self.settings(MIDDLEWARE=without_cache):
+            response = self.client.get(self.post_url)
+        self.assertNotContains(response, '<!--hole:')
+        self.assertContains(response, 'Пользователь: writer')
+        self.assertContains(response, 'Редактировать')
+        # Страница не из кэша: метки не ставятся и не сшиваются.
+        response = self.client.get(reverse('follow_index'))
+        self.assertNotContains(response, '<!--hole:')
+        self.assertContains(response, 'Пользователь: writer')
+        html = render_to_string('base.html')
+        self.assertNotIn('<!--hole:', html)
+        self.assertIn('Регистрация', html)
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+@override_settings(SYNDICATION_ITEMS=3)
+class SyndicationFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='writer',
+                                              first_name='Лев',
+                                              last_name='Толстой')
+        cls.group = Group.objects.create(title='Море', slug='sea')
+        cls.posts = [Post.objects.create(text=f'Пост номер {i}',
+                                         author=cls.author,
+                                         group=cls.group if i % 2 else None)
+                     for i in range(5)]
+
+    def setUp(self):
+        cache.clear()
+        self.urls = (
+            reverse('index_rss'), reverse('index_atom'),
+            reverse('slug_rss', args=['sea']),
+            reverse('slug_atom', args=['sea']),
+            reverse('profile_rss', args=['writer']),
+            reverse('profile_atom', args=['writer']),
+        )
+
+    def test_feeds_list_recent_posts(self):
+        response = self.client.get(reverse('index_rss'))
+        self.assertEqual(response['Content-Type'],
+                         'application/rss+xml; charset=utf-8')
+        self.assertContains(response, '<item>', count=3)
+        self.assertContains(response, 'Пост номер 4')
+        self.assertNotContains(response, 'Пост номер 1<')
+        response = self.client.get(reverse('slug_atom', args=['sea']))
+        self.assertTrue(response['Content-Type'].startswith(
+            'application/atom+xml'))
+        self.assertContains(response, '<entry>', count=2)
+        self.assertContains(response, 'Лев Толстой')
+        self.assertEqual(
+            self.client.get(reverse('slug_rss', args=['none'])).status_code,
+            404)
+
+    def test_feed_urls_do_not_shadow_pages(self):
+        for name in ('rss', 'atom', 'group'):
+            User.objects.create_user(username=name)
+        for slug in ('rss', 'atom'):
+            Group.objects.create(title=slug, slug=slug)
+        for url, template in ((reverse('profile', args=['rss']),
+                               'profile.html'),
+                              (reverse('profile', args=['atom']),
+                               'profile.html'),
+                              (reverse('slug', args=['rss']), 'group.html'),
+                              (reverse('slug', args=['atom']), 'group.html')):
+            with self.subTest(url=url):
+                self.assertTemplateUsed(self.client.get(url), template)
+        response = self.client.get(reverse('profile_rss', args=['group']))
+        self.assertContains(response, 'Новые записи автора group.')
+        self.assertContains(
+            self.client.get(reverse('slug_rss', args=['rss'])),
+            'Yatube: сообщество rss')
+
+    def test_polling_costs_no_queries(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertFalse(response['ETag'].startswith('W/'))
+                with self.assertNumQueries(0):
+                    again = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(again.status_code, 304)
+                with self.assertNumQueries(0):
+                    self.client.get(url)
+
+    def test_new_post_invalidates_feeds(self):
+        responses = {url: self.client.get(url) for url in self.urls}
+        Post.objects.create(text='Свежий пост', author=self.author,
+                            group=self.group)
+        for url, response in responses.items():
+            with self.subTest(url=url):
+                again = self.client.get(url,
+                                        HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertContains(again, 'Свежий пост')
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='writer')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Море', slug='sea')
+        cls.posts = [Post.objects.create(text=f'Пост {i}', author=cls.author,
+                                         group=cls.group)
+                     for i in range(5)]
+        Post.objects.filter(pk=cls.posts[0].pk).update(
+            image='posts/sea.jpg')
+        cls.comment = Comment.objects.create(
+            post=cls.posts[1], author=cls.author, text='Сам себе, "привет"')
+        Comment.objects.create(post=cls.posts[1], author=cls.reader,
+                               text='Чужой')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.author)
+        self.url = reverse('export', kwargs={'username': 'writer',
+                                             'fmt': 'ndjson'})
+
+    def test_ndjson_streams_posts_and_comments(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="writer.ndjson"')
+        rows = [json.loads(line) for line in
+                b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(row['type'], row['id']) for row in rows],
+                         [('post', post.pk) for post in self.posts]
+                         + [('comment', self.comment.pk)])
+        self.assertEqual(rows[0]['image_path'], 'posts/sea.jpg')
+        self.assertEqual(rows[0]['image'],
+                         settings.MEDIA_URL + 'posts/sea.jpg')
+        self.assertEqual(rows[1]['group'], 'sea')
+        self.assertEqual(rows[-1]['post_id'], self.posts[1].pk)
+
+    def test_csv(self):
+        response = self.client.get(
+            reverse('export', kwargs={'username': 'writer', 'fmt': 'csv'}))
+        content = b''.join(response.streaming_content).decode()
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[-1]['text'], 'Сам себе, "привет"')
+
+    def test_unknown_format_and_group_named_export(self):
+        response = self.client.get(
+            reverse('export', kwargs={'username': 'writer', 'fmt': 'xml'}))
+        self.assertEqual(response.status_code, 400)
+        Group.objects.create(title='Экспорт', slug='export')
+        self.assertTemplateUsed(
+            self.client.get(reverse('slug', args=['export'])), 'group.html')
+
+    def test_only_author_and_staff_may_export(self):
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.reader.is_staff = True
+        self.reader.save()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+
+@override_settings(POSTS_PER_PAGE=2)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='writer')
+        cls.other = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Море', slug='sea')
+        cls.sea_posts = [
+            Post.objects.create(text=f'Пост {i} про море и <b>чайки</b>',
+                                author=cls.author, group=cls.group)
+            for i in range(3)]
+        cls.other_post = Post.objects.create(text='Море зимой',
+                                             author=cls.other)
+        Post.objects.create(text='Про горы', author=cls.other)
+
+    def search(self, **params):
+        response = self.client.get(reverse('search'), params)
+        return response.context['page']
+
+    def test_ranked_results_and_keyset_pages(self):
+        page = self.search(q='море')
+        found = list(page)
+        self.assertEqual(len(found), 2)
+        self.assertTrue(page.has_next())
+        rest = list(self.search(q='море', after=page.next_cursor))
+        self.assertEqual(len(rest), 2)
+        self.assertEqual({post.pk for post in found + rest},
+                         {post.pk for post in self.sea_posts}
+                         | {self.other_post.pk})
+
+    def test_filters_by_group_and_author(self):
+        by_group = {post.pk for post in self.search(q='море', group='sea')}
+        self.assertEqual(by_group, {post.pk for post in self.sea_posts[:2]})
+        by_author = [post.pk for post in self.search(q='море',
+                                                     author='reader')]
+        self.assertEqual(by_author, [self.other_post.pk])
+
+    def test_snippet_is_highlighted_and_escaped(self):
+        post = list(self.search(q='чайки'))[0]
+        self.assertIn('<mark>чайки</mark>', post.snippet)
+        self.assertIn('&lt;b&gt;', post.snippet)
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.get(pk=self.sea_posts[0].pk)
+        post.text = 'Теперь про лес'
+        post.save()
+        self.assertEqual([p.pk for p in self.search(q='лес')], [post.pk])
+        post.delete()
+        self.assertEqual(list(self.search(q='лес')), [])
+
+    def test_results_use_post_card(self):
+        response = self.client.get(reverse('search'), {'q': 'море'})
+        self.assertTemplateUsed(response, 'includes/post_item.html')
+        self.assertContains(response, '<mark>море</mark>')
+        self.assertContains(response, 'href="?q=%D0%BC%D0%BE%D1%80%D0%B5'
+                                      '&amp;after=')
+
+    def test_triggers_exist_after_migrate(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                "AND tbl_name = 'posts_post'")
+            triggers = {name for name, in cursor.fetchall()}
+        self.assertEqual(triggers, {'posts_post_fts_insert',
+                                    'posts_post_fts_delete',
+                                    'posts_post_fts_update'})
+
+    def test_fts_syntax_in_query_is_ignored(self):
+        self.assertEqual(list(self.search(q='"море" OR NEAR(')), [])
+        self.assertIsNone(self.search(q=''))
+
+    def test_admin_search_uses_index(self):
+        post_admin = PostAdmin(Post, admin.site)
+        found, _ = post_admin.get_search_results(
+            None, Post.objects.all(), 'зимой')
+        self.assertEqual(list(found), [self.other_post])
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='Ёжик', first_name='Пётр', last_name='Иванов')
+        User.objects.create_user(username='ежевика')
+        User.objects.create_user(username='другой')
+        cls.group = Group.objects.create(title='Ежедневные заметки',
+                                         slug='daily')
+
+    def setUp(self):
+        cache.clear()
+
+    def suggest(self, **params):
+        response = self.client.get(reverse('autocomplete'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_prefix_is_normalized(self):
+        labels = [item['label']
+                  for item in self.suggest(q='ЕЖ', kind='user')]
+        self.assertEqual(labels, ['ежевика', 'Ёжик (Пётр Иванов)'])
+        by_name = self.suggest(q='пет', kind='user')
+        self.assertEqual(by_name[0]['url'],
+                         reverse('profile', args=['Ёжик']))
+
+    def test_users_and_groups_together(self):
+        types = {item['type'] for item in self.suggest(q='еже')}
+        self.assertEqual(types, {'user', 'group'})
+        self.assertEqual(self.suggest(q='daily')[0]['url'],
+                         reverse('slug', args=['daily']))
+        self.assertEqual(self.suggest(q=''), [])
+
+    def test_index_follows_changes(self):
+        self.group.title = 'Заметки'
+        self.group.save()
+        cache.clear()
+        self.assertEqual(self.suggest(q='еже', kind='group'), [])
+        User.objects.get(username='другой').delete()
+        self.assertEqual(self.suggest(q='друг'), [])
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        cls.media = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media.enable()
+        cls.user = User.objects.create_user(username='photographer')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def upload(self, name='photo.png'):
+        buffer = BytesIO()
+        Image.new('RGB', (64, 32), (200, 40, 40)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(),
+                                  content_type='image/png')
+
+    def test_feed_shows_placeholder_until_thumbnail_is_ready(self):
+        post = Post.objects.create(text='С картинкой', author=self.user,
+                                   image=self.upload())
+        response = self.client.get(reverse('index'))
+        self.assertNotContains(response, '<img class="card-img"')
+        thumbnails.generate(post.pk, post.image.name,
+                            post_feeds(post.author_id, post.group_id))
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, '<img class="card-img"')
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, ' 480w, ')
+        post.refresh_from_db()
+        self.assertTrue(post.image_lqip.startswith('data:image/jpeg;base64'))
+        self.assertContains(response, post.image_lqip)
+
+    def test_upload_generates_every_preset(self):
+        with mock.patch('posts.thumbnails.transaction.on_commit',
+                        lambda func: func()):
+            self.client.post(reverse('new_post'),
+                             {'text': 'Новый пост', 'image': self.upload()})
+        post = Post.objects.get(text='Новый пост')
+        for preset in settings.THUMBNAIL_PRESETS:
+            with self.subTest(preset=preset):
+                self.assertIsNotNone(
+                    thumbnails.cached_thumbnail(post.image, preset))
+                _, ready = thumbnails.resolve(post, preset)
+                self.assertEqual(
+                    {fmt: len(items) for fmt, items in ready.items()},
+                    {fmt: len(settings.THUMBNAIL_WIDTHS)
+                     for fmt in settings.THUMBNAIL_FORMATS})
+
+    def test_feed_resolves_thumbnails_in_one_batch(self):
+        for i in range(3):
+            post = Post.objects.create(text=f'Пост {i}', author=self.user,
+                                       image=self.upload(f'{i}.png'))
+            thumbnails.generate(post.pk, post.image.name, [])
+        cache.clear()
+        kvstore = thumbnails.default.kvstore
+        # Адреса сохранены в постах: хранилище ключей не читается.
+        with mock.patch.object(kvstore, 'get') as get, \
+                mock.patch.object(kvstore, 'get_many') as get_many:
+            response = self.client.get(reverse('index'))
+        get.assert_not_called()
+        get_many.assert_not_called()
+        self.assertContains(response, '<img class="card-img"', count=3)
+        # Без сохранённых адресов — один пакет на всю страницу.
+        Post.objects.update(image_thumbnails='')
+        cache.clear()
+        with mock.patch.object(kvstore, 'get') as get, \
+                mock.patch.object(kvstore, 'get_many',
+                                  wraps=kvstore.get_many) as get_many:
+            response = self.client.get(reverse('index'))
+        get.assert_not_called()
+        get_many.assert_called_once()
+        self.assertContains(response, '<img class="card-img"', count=3)
+
+    def test_stored_thumbnails_follow_the_image(self):
+        post = Post.objects.create(text='С картинкой', author=self.user,
+                                   image=self.upload())
+        thumbnails.generate(post.pk, post.image.name, [])
+        post.refresh_from_db()
+        fallback, ready = thumbnails.stored(post)['feed']
+        cached = thumbnails.cached_thumbnail(post.image, 'feed')
+        self.assertEqual(fallback, (cached.url, cached.width, cached.height))
+        self.assertEqual(set(ready), set(settings.THUMBNAIL_FORMATS))
+        post.image = self.upload('other.png')
+        post.save()
+        self.assertIsNone(thumbnails.stored(post))
+
+    def test_thumbnails_are_scheduled_only_for_new_images(self):
+        post = Post.objects.create(text='С картинкой', author=self.user,
+                                   image=self.upload())
+        thumbnails.generate(post.pk, post.image.name, [])
+        post.refresh_from_db()
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            post.text = 'Исправленный текст'
+            post.save()
+            schedule.assert_not_called()
+            post.image = self.upload('other.png')
+            post.save()
+            schedule.assert_called_once_with(post)
@@ -0,0 +1,266 @@
+import base64
+import json
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.db import connections, transaction
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from .cache import acquire, invalidate, post_feeds, release
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+
+# Сколько секунд картинка считается занятой воркером, если тот упал,
+# не сняв блокировку.
+GENERATE_LOCK_TIMEOUT = 300
+
+
+MIME_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png',
+              'WEBP': 'image/webp'}
+
+# Миниатюра, сохранённая в Post.image_thumbnails: шаблону нужны только
+# адрес и размеры, как у ImageFile.
+StoredThumbnail = namedtuple('StoredThumbnail', 'url width height')
+
+
+def preset(name):
+    """Геометрия и параметры sorl для пресета из THUMBNAIL_PRESETS."""
+    geometry, options = settings.THUMBNAIL_PRESETS[name]
+    return geometry, dict(options)
+
+
+def variants(name):
+    """
+    Варианты пресета для srcset: (формат, ширина, геометрия, параметры).
+
+    Ширины берутся из THUMBNAIL_WIDTHS, высота — из пропорций
+    пресета, форматы — из THUMBNAIL_FORMATS.
+    """
+    geometry, options = preset(name)
+    width, height = (int(side) for side in geometry.split('x'))
+    for fmt in settings.THUMBNAIL_FORMATS:
+        for variant_width in settings.THUMBNAIL_WIDTHS:
+            variant_height = round(variant_width * height / width)
+            yield (fmt, variant_width, f'{variant_width}x{variant_height}',
+                   dict(options, format=fmt))
+
+
+def _thumbnail_file(image, geometry, options):
+    """ImageFile будущей миниатюры: имя считается без чтения исходника."""
+    backend = default.backend
+    source = ImageFile(image)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in ThumbnailBackend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    filename = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(filename, default.storage)
+
+
+def thumbnail_files(image, name):
+    """Основная миниатюра пресета и [(формат, ширина, ImageFile), ...]."""
+    fallback = _thumbnail_file(image, *preset(name))
+    files = [(fmt, width, _thumbnail_file(image, geometry, options))
+             for fmt, width, geometry, options in variants(name)]
+    return fallback, files
+
+
+def _collect(fallback, files, lookup):
+    ready = {}
+    for fmt, width, image_file in files:
+        thumbnail = lookup(image_file)
+        if thumbnail is not None:
+            ready.setdefault(fmt, []).append((width, thumbnail))
+    return lookup(fallback), ready
+
+
+def cached_thumbnail(image, name):
+    """
+    Готовая миниатюра из хранилища ключей sorl или None.
+
+    В отличие от тега {% thumbnail %} никогда не открывает исходник,
+    поэтому рендер ленты не ждёт Pillow.
+    """
+    return default.kvstore.get(_thumbnail_file(image, *preset(name)))
+
+
+def _dump(thumbnail):
+    return [thumbnail.url, thumbnail.width, thumbnail.height]
+
+
+def stored(post):
+    """
+    Миниатюры, которые generate() сохранил в post.image_thumbnails.
+
+    Возвращает {пресет: (основная, {формат: [...]})} или None, если
+    их ещё нет или они сняты с прежней картинки поста.
+    """
+    if not post.image or not post.image_thumbnails:
+        return None
+    data = json.loads(post.image_thumbnails)
+    if data['image'] != post.image.name:
+        return None
+    return {
+        name: (StoredThumbnail(*preset_data['fallback']), {
+            fmt: [(width, StoredThumbnail(*thumbnail))
+                  for width, *thumbnail in items]
+            for fmt, items in preset_data['ready'].items()})
+        for name, preset_data in data['presets'].items()
+    }
+
+
+def resolve(post, name):
+    """
+    Готовые миниатюры пресета для поста: (основная, {формат: [...]}).
+
+    Берёт результат prefetch(), если он был, затем сохранённые в
+    посте адреса и только потом хранилище ключей по одной миниатюре.
+    """
+    prefetched = getattr(post, 'thumbnails', None)
+    if prefetched is None:
+        prefetched = post.thumbnails = stored(post) or {}
+    if name in prefetched:
+        return prefetched[name]
+    fallback, files = thumbnail_files(post.image, name)
+    return _collect(fallback, files, default.kvstore.get)
+
+
+def prefetch(posts):
+    """
+    Находит миниатюры всех пресетов для списка постов разом.
+
+    Результат кладётся в post.thumbnails, откуда его берёт resolve().
+    Обычно адреса уже сохранены в посте; хранилище ключей читается
+    только для остальных, и хранилище с get_many
+    (posts.kvstore.KVStore) отвечает одним пакетным запросом на всю
+    страницу. Вызывается явно, как prefetch_related_objects, —
+    например, через prefetch у paginate().
+    """
+    wanted = []
+    for post in posts:
+        post.thumbnails = stored(post) or {}
+        if post.image and not post.thumbnails:
+            wanted.extend((post, name, *thumbnail_files(post.image, name))
+                          for name in settings.THUMBNAIL_PRESETS)
+    if not wanted:
+        return
+    kvstore = default.kvstore
+    if hasattr(kvstore, 'get_many'):
+        image_files = [fallback for _, _, fallback, _ in wanted]
+        image_files.extend(image_file for *_, files in wanted
+                           for _, _, image_file in files)
+        found = kvstore.get_many(image_files)
+
+        def lookup(image_file):
+            return found.get(image_file.key)
+    else:
+        lookup = kvstore.get
+    for post, name, fallback, files in wanted:
+        post.thumbnails[name] = _collect(fallback, files, lookup)
+
+
+def placeholder(name):
+    """
+    Крошечное превью картинки в виде data URI (LQIP).
+
+    Для JPEG Pillow декодирует сразу уменьшенную копию (draft),
+    поэтому полноразмерный исходник в память не разворачивается.
+    """
+    width = settings.LQIP_WIDTH
+    with default.storage.open(name) as source:
+        image = Image.open(source)
+        image.draft('RGB', (width * 4, width * 4))
+        image = image.convert('RGB')
+        image.thumbnail((width, width * 4))
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=40)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/jpeg;base64,{encoded}'
+
+
+def generate(post_id, name, feeds):
+    """
+    Создаёт все варианты всех пресетов и LQIP для картинки поста.
+
+    Адреса и размеры миниатюр сохраняются в Post.image_thumbnails,
+    чтобы ленты не обращались за ними к хранилищу ключей. Затем
+    сбрасывает кэш лент feeds: в них до этого была заглушка.
+    """
+    try:
+        presets = {}
+        for preset_name in settings.THUMBNAIL_PRESETS:
+            geometry, options = preset(preset_name)
+            fallback = get_thumbnail(name, geometry, **options)
+            ready = {}
+            for fmt, width, geometry, options in variants(preset_name):
+                thumbnail = get_thumbnail(name, geometry, **options)
+                ready.setdefault(fmt, []).append([width, *_dump(thumbnail)])
+            presets[preset_name] = {'fallback': _dump(fallback),
+                                    'ready': ready}
+        Post.objects.filter(pk=post_id, image=name).update(
+            image_lqip=placeholder(name),
+            image_thumbnails=json.dumps({'image': name,
+                                         'presets': presets}))
+        invalidate(*feeds)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+    finally:
+        release(_lock_name(name))
+        if settings.THUMBNAIL_WORKERS:
+            connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(settings.THUMBNAIL_WORKERS,
+                                       thread_name_prefix='thumbnails')
+    return _executor
+
+
+def _lock_name(name):
+    return f'thumbnails:{name}'
+
+
+def _submit(post_id, name, feeds):
+    # Блокировка в общем кэше: одну картинку не пережимают параллельно
+    # ни потоки этого процесса, ни другие воркеры.
+    if not acquire(_lock_name(name), GENERATE_LOCK_TIMEOUT):
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        generate(post_id, name, feeds)
+        return
+    with _lock:
+        executor = _get_executor()
+    executor.submit(generate, post_id, name, feeds)
+
+
+def schedule(post):
+    """
+    Ставит генерацию миниатюр в очередь пула THUMBNAIL_WORKERS.
+
+    Задача уходит после коммита транзакции, когда файл и запись
+    поста уже видны воркеру. При THUMBNAIL_WORKERS = 0 миниатюры
+    создаются в текущем потоке.
+    """
+    if post.image:
+        post_id, name = post.pk, post.image.name
+        feeds = post_feeds(post.author_id, post.group_id, post.pk)
+        transaction.on_commit(lambda: _submit(post_id, name, feeds))
@@ -0,0 +1,242 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Follow, Post, TimelineEntry, User, UserStats
+
+# Сколько лент обрезается одним запросом: держит число параметров
+# ниже лимита SQLite.
+TRIM_BATCH_SIZE = 500
+
+
+def _followers(author_id):
+    """
+    Подписчики автора или None, если их больше TIMELINE_FANOUT_LIMIT.
+
+    Посты таких авторов не раскладываются по лентам, а подмешиваются
+    при чтении, чтобы одна публикация не порождала огромную запись.
+    """
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    followers = list(Follow.objects.filter(author_id=author_id)
+                     .values_list('user_id', flat=True)[:limit + 1])
+    if len(followers) > limit:
+        return None
+    return followers
+
+
+def fan_out(post):
+    """Добавляет новый пост в ленты подписчиков автора."""
+    followers = _followers(post.author_id)
+    if not followers:
+        return
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers],
+        ignore_conflicts=True)
+    trim(*followers)
+
+
+def backfill(user_id, author_id):
+    """Переносит в ленту последние посты автора при подписке."""
+    if _followers(author_id) is None:
+        return
+    posts = (Post.objects.filter(author_id=author_id)
+             .order_by('-pub_date')
+             .values_list('id', 'pub_date')[:settings.TIMELINE_LENGTH])
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts],
+        ignore_conflicts=True)
+    trim(user_id)
+
+
+def remove(user_id, author_id):
+    """
+    Убирает из ленты посты автора при отписке.
+
+    Счётчик подписчиков к этому моменту уже уменьшен (сигнал
+    follow_count_deleted подключён раньше). Если автор только что
+    опустился до TIMELINE_FANOUT_LIMIT, его посты больше не
+    подмешиваются при чтении, и ленты подписчиков нужно дополнить
+    постами, которые он написал, пока был «звездой».
+    """
+    TimelineEntry.objects.filter(user_id=user_id,
+                                 post__author_id=author_id).delete()
+    if UserStats.objects.filter(
+            user_id=author_id,
+            follower_count=settings.TIMELINE_FANOUT_LIMIT).exists():
+        backfill_followers(author_id)
+
+
+def backfill_followers(author_id):
+    """
+    Переносит последние посты автора в ленты всех его подписчиков.
+
+    Один INSERT ... SELECT вместо backfill() на каждого подписчика;
+    уже разложенные посты пропускаются по уникальному ключу.
+    """
+    ops = connection.ops
+    sql = f"""
+        {ops.insert_statement(ignore_conflicts=True)}
+        {TimelineEntry._meta.db_table} (user_id, post_id, pub_date)
+        SELECT f.user_id, p.id, p.pub_date
+        FROM {Follow._meta.db_table} f, (
+            SELECT id, pub_date FROM {Post._meta.db_table}
+            WHERE author_id = %s
+            ORDER BY pub_date DESC, id DESC
+            LIMIT %s
+        ) p
+        WHERE f.author_id = %s
+        {ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [author_id, settings.TIMELINE_LENGTH, author_id])
+    trim(*Follow.objects.filter(author_id=author_id)
+         .values_list('user_id', flat=True))
+
+
+def trim(*user_ids):
+    """
+    Оставляет в лентах user_ids не больше TIMELINE_LENGTH свежих записей.
+
+    Граница — полный ключ сортировки ленты (pub_date, post_id), так
+    что записи внутри лимита с той же датой, что и у первой лишней,
+    остаются. Ленты обрезаются пачками по TRIM_BATCH_SIZE одним
+    DELETE с оконной функцией на пачку.
+    """
+    table = TimelineEntry._meta.db_table
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), TRIM_BATCH_SIZE):
+        batch = user_ids[start:start + TRIM_BATCH_SIZE]
+        sql = f"""
+            DELETE FROM {table} WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY user_id
+                        ORDER BY pub_date DESC, post_id DESC) AS position
+                    FROM {table}
+                    WHERE user_id IN ({', '.join(['%s'] * len(batch))})
+                ) ranked
+                WHERE position > %s
+            )
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*batch, settings.TIMELINE_LENGTH])
+
+
+def pulled_authors(user):
+    """Авторы из подписок пользователя, чьи посты читаются напрямую."""
+    return (User.objects
+            .filter(following__user=user,
+                    stats__follower_count__gt=settings.TIMELINE_FANOUT_LIMIT)
+            .values_list('id', flat=True))
+
+
+def timeline_posts(user):
+    """Лента подписок: материализованные записи плюс посты «звёзд»."""
+    pulled = list(pulled_authors(user))
+    if not pulled:
+        return (Post.objects.filter(timeline_entries__user=user)
+                .order_by('-timeline_entries__pub_date', '-id'))
+    entries = TimelineEntry.objects.filter(user=user).values('post_id')
+    return (Post.objects.filter(Q(id__in=entries) | Q(author_id__in=pulled))
+            .order_by('-pub_date', '-id'))
+
+
+def rebuild(user_id):
+    """Пересобирает ленту пользователя с нуля."""
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    for author_id in (Follow.objects.filter(user_id=user_id)
+                      .values_list('author_id', flat=True)):
+        backfill(user_id, author_id)
+
+
+def _rebuild_sql(users=''):
+    """
+    INSERT ... SELECT, раскладывающий посты по лентам подписчиков.
+
+    Каждая лента обрезается до TIMELINE_LENGTH, поэтому от автора
+    заранее берутся только TIMELINE_LENGTH его свежих постов: иначе
+    подписки на плодовитых авторов раздувают промежуточную выборку до
+    сотен миллионов строк. users — SQL-список id, которым ограничены
+    и ленты, и авторы: читаются только посты тех, на кого подписаны
+    эти пользователи. CROSS JOIN закрепляет порядок соединения: сначала
+    подписки, затем свежие посты автора по автоматическому индексу.
+    Иначе SQLite идёт от постов и ищет подписку каждого пользователя
+    на каждый пост.
+    """
+    posts = Post._meta.db_table
+    follows = Follow._meta.db_table
+    authors = ''
+    followers = ''
+    if users:
+        authors = (f'WHERE author_id IN (SELECT author_id FROM {follows} '
+                   f'WHERE user_id IN ({users}))')
+        followers = f'AND f.user_id IN ({users})'
+    return f"""
+        WITH recent AS (
+            SELECT id, author_id, pub_date FROM (
+                SELECT id, author_id, pub_date,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY author_id
+                           ORDER BY pub_date DESC, id DESC) AS position
+                FROM {posts}
+                {authors}
+            ) numbered
+            WHERE position <= %s
+        )
+        INSERT INTO {TimelineEntry._meta.db_table} (user_id, post_id, pub_date)
+        SELECT user_id, post_id, pub_date FROM (
+            SELECT f.user_id, p.id AS post_id, p.pub_date,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY f.user_id
+                       ORDER BY p.pub_date DESC, p.id DESC) AS position
+            FROM {follows} f
+            JOIN {UserStats._meta.db_table} s ON s.user_id = f.author_id
+            CROSS JOIN recent p ON p.author_id = f.author_id
+            WHERE s.follower_count <= %s {followers}
+        ) ranked
+        WHERE position <= %s
+    """
+
+
+def rebuild_all():
+    """
+    Пересобирает ленты всех пользователей одним INSERT ... SELECT.
+
+    Нужна, только если ленты могли разойтись с подписками везде;
+    после загрузки данных хватает rebuild_users для затронутых ею
+    пользователей.
+    """
+    with transaction.atomic():
+        TimelineEntry.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(_rebuild_sql(), [settings.TIMELINE_LENGTH,
+                                            settings.TIMELINE_FANOUT_LIMIT,
+                                            settings.TIMELINE_LENGTH])
+        # Для запросов с WITH модуль sqlite3 не сообщает rowcount.
+        return TimelineEntry.objects.count()
+
+
+def rebuild_users(user_ids):
+    """
+    Пересобирает ленты user_ids тем же запросом, пачками.
+
+    Пачка — TRIM_BATCH_SIZE пользователей и своя транзакция, так что
+    чужие ленты не трогаются, а объём одной выборки ограничен.
+    Возвращает число записей в пересобранных лентах.
+    """
+    user_ids = sorted(user_ids)
+    entries = 0
+    for start in range(0, len(user_ids), TRIM_BATCH_SIZE):
+        batch = user_ids[start:start + TRIM_BATCH_SIZE]
+        sql = _rebuild_sql(', '.join(['%s'] * len(batch)))
+        with transaction.atomic():
+            TimelineEntry.objects.filter(user_id__in=batch).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [*batch, settings.TIMELINE_LENGTH,
+                                     settings.TIMELINE_FANOUT_LIMIT, *batch,
+                                     settings.TIMELINE_LENGTH])
+            entries += TimelineEntry.objects.filter(
+                user_id__in=batch).count()
+    return entries
@@ -0,0 +1,94 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from PIL import Image, ImageOps
+
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+ORIENTATION = 0x0112
+
+
+def _has_alpha(image):
+    return (image.mode in ('RGBA', 'LA')
+            or (image.mode == 'P' and 'transparency' in image.info))
+
+
+def _decode(image, cap):
+    """Декодирует картинку не больше cap по длинной стороне."""
+    width, height = image.size
+    if image.format == 'JPEG':
+        scale = min(1, cap / max(width, height))
+        image.draft('RGB', (round(width * scale), round(height * scale)))
+    # Каждая лишняя копия — ещё один полный буфер пикселей, поэтому
+    # поворот и смена режима делаются только при необходимости.
+    if image.getexif().get(ORIENTATION, 1) != 1:
+        image = ImageOps.exif_transpose(image)
+    alpha = _has_alpha(image)
+    mode = 'RGBA' if alpha else 'RGB'
+    if image.mode != mode:
+        image = image.convert(mode)
+    image.thumbnail((cap, cap), Image.LANCZOS)
+    image.load()
+    image.info = {}
+    return image, alpha
+
+
+def normalize_image(upload):
+    """
+    Проверяет и пережимает загруженную картинку.
+
+    Файл уже лежит на диске (TemporaryFileUploadHandler пишет его
+    кусками), а Pillow сначала читает только заголовок: формат и
+    размеры проверяются до декодирования, поэтому «бомбы» отсекаются
+    без выделения памяти под пиксели. JPEG декодируется сразу
+    в уменьшенном масштабе (draft) и может быть до IMAGE_MAX_PIXELS;
+    остальные форматы декодируются целиком, поэтому для них предел
+    ниже — IMAGE_MAX_DECODED_PIXELS. Затем картинка поворачивается
+    по EXIF, теряет метаданные и пережимается не больше IMAGE_MAX_SIDE
+    по длинной стороне: результат ограничен этим размером, поэтому
+    держится в памяти.
+    """
+    if upload.size > settings.IMAGE_UPLOAD_MAX_SIZE:
+        raise ValidationError(
+            'Файл больше %(limit)d МБ.',
+            code='file_too_large',
+            params={'limit': settings.IMAGE_UPLOAD_MAX_SIZE // 2 ** 20})
+    if hasattr(upload, 'temporary_file_path'):
+        source = upload.temporary_file_path()
+    else:
+        upload.seek(0)
+        source = upload
+
+    cap = settings.IMAGE_MAX_SIDE
+    with Image.open(source) as image:
+        if image.format not in ALLOWED_FORMATS:
+            raise ValidationError('Неподдерживаемый формат картинки.',
+                                  code='invalid_format')
+        width, height = image.size
+        limit = settings.IMAGE_MAX_PIXELS
+        if image.format != 'JPEG':
+            limit = min(limit, settings.IMAGE_MAX_DECODED_PIXELS)
+        if width * height > limit:
+            raise ValidationError(
+                'Картинка %(width)d×%(height)d слишком большая.',
+                code='too_many_pixels',
+                params={'width': width, 'height': height})
+        # Обрезанный или испорченный файл проходит verify() ImageField
+        # и падает только при декодировании.
+        try:
+            image, alpha = _decode(image, cap)
+        except (OSError, SyntaxError, Image.DecompressionBombError):
+            raise ValidationError('Файл картинки повреждён.',
+                                  code='invalid_image')
+
+    fmt, extension = ('PNG', '.png') if alpha else ('JPEG', '.jpg')
+    name = os.path.splitext(os.path.basename(upload.name))[0] + extension
+    buffer = BytesIO()
+    image.save(buffer, fmt, quality=settings.IMAGE_QUALITY, optimize=True)
+    result = InMemoryUploadedFile(buffer, 'image', name, Image.MIME[fmt],
+                                  buffer.tell(), None)
+    result.seek(0)
+    result.image = image
+    return result
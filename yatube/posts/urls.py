@@ -1,14 +1,32 @@
 from django.urls import path
 
-from . import views
+from . import feeds, views
 
 urlpatterns = [
     path("", views.index, name="index"),
     path("follow/", views.follow_index, name="follow_index"),
+    # Ленты — «файлы» без завершающего слэша: такие пути не совпадают
+    # ни с профилем <username>/, ни с сообществом group/<slug>/, какими
+    # бы ни были имя пользователя и slug (в slug точки не бывает).
+    path("feed.rss", feeds.PostsFeed(), name="index_rss"),
+    path("feed.atom", feeds.PostsAtomFeed(), name="index_atom"),
+    path("group/<slug:slug>/feed.rss", feeds.GroupPostsFeed(),
+         name="slug_rss"),
+    path("group/<slug:slug>/feed.atom", feeds.GroupPostsAtomFeed(),
+         name="slug_atom"),
+    path("<str:username>/feed.rss", feeds.ProfilePostsFeed(),
+         name="profile_rss"),
+    path("<str:username>/feed.atom", feeds.ProfilePostsAtomFeed(),
+         name="profile_atom"),
     path(
         "<str:username>/follow/", views.profile_follow, name="profile_follow"
     ),
+    # Как и ленты, выгрузка — «файл»: <username>/export/ перекрывал
+    # сообщество со slug export.
+    path("<str:username>/export.<str:fmt>", views.export, name="export"),
     path("new/", views.new_post, name="new_post"),
+    path("search/", views.search, name="search"),
+    path("autocomplete/", views.autocomplete, name="autocomplete"),
     path(
         "<str:username>/<int:post_id>/edit/",
         views.post_edit,
@@ -1,74 +1,165 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.core.paginator import Paginator
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import (HttpResponseBadRequest, JsonResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
 
-from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post
+from . import autocomplete as prefix_index
+from . import thumbnails
+from .cache import conditional, feed_cache_key
+from .counters import user_stats
+from .exports import FORMATS, export_lines
+from .forms import CommentForm, PostForm, SearchForm
+from .models import Follow, Group, Post, PrefixEntry
+from .paginators import CursorPaginator, paginate
+from .search import search_posts
+from .timeline import timeline_posts
 
 
 def index(request):
-    posts = Post.objects.all()
-    paginator = Paginator(posts, 10)
-    page_num = request.GET.get('page')
-    page = paginator.get_page(page_num)
-    return render(
-        request,
-        'index.html',
-        {'page': page}
-    )
+    feed_key = feed_cache_key(request, 'index')
+
+    def build():
+        posts = Post.objects.for_feed()
+        page = paginate(request, posts, 'index',
+                        prefetch=thumbnails.prefetch)
+        return render(
+            request,
+            'index.html',
+            {'page': page, 'feed_key': feed_key}
+        )
+
+    return conditional(request, feed_key, ['index'], build)
 
 
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.group_posts.all()
-    paginator = Paginator(posts, 10)
-    page_num = request.GET.get('page')
-    page = paginator.get_page(page_num)
+    names = [f'group:{group.pk}']
+    feed_key = feed_cache_key(request, *names)
 
-    return render(request, 'group.html',
-                  {'group': group, 'page': page, 'paginator': paginator})
+    def build():
+        posts = group.group_posts.for_feed()
+        page = paginate(request, posts, 'group_posts',
+                        prefetch=thumbnails.prefetch)
+        return render(request, 'group.html',
+                      {'group': group, 'page': page,
+                       'paginator': page.paginator, 'feed_key': feed_key})
+
+    return conditional(request, feed_key, names, build)
 
 
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.user_posts.all()
-    paginator = Paginator(posts, 10)
-    page_num = request.GET.get('page')
-    page = paginator.get_page(page_num)
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user, author=author).exists()
-        return render(
-            request,
-            'profile.html',
-            {'page': page, 'paginator': paginator,
-             'author': author, 'following': following}
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
+    names = [f'profile:{author.pk}']
+    feed_key = feed_cache_key(request, *names)
+
+    def build():
+        user_stats(author)
+        posts = author.user_posts.for_feed()
+        page = paginate(request, posts, 'profile',
+                        prefetch=thumbnails.prefetch)
+        return render(request, 'profile.html',
+                      {'page': page, 'paginator': page.paginator,
+                       'author': author, 'feed_key': feed_key})
+
+    return conditional(request, feed_key, names, build)
+
+
+def search(request):
+    form = SearchForm(request.GET or None)
+    page = None
+    if form.is_valid() and form.cleaned_data['q']:
+        page = search_posts(
+            form.cleaned_data['q'],
+            settings.POSTS_PER_PAGE,
+            group=form.cleaned_data['group'],
+            author=form.cleaned_data['author'],
+            after=request.GET.get('after'),
         )
-    return render(request, 'profile.html',
-                  {'page': page, 'paginator': paginator, 'author': author})
+    return render(request, 'search.html', {'form': form, 'page': page})
+
+
+def autocomplete(request):
+    """
+    Подсказки для строки поиска: ?q=<начало имени>&kind=user|group.
+
+    Без kind возвращает и пользователей, и сообщества.
+    """
+    prefix = request.GET.get('q', '')
+    kinds = [kind for kind, _ in PrefixEntry.KINDS]
+    if request.GET.get('kind') in kinds:
+        kinds = [request.GET['kind']]
+    url_names = {PrefixEntry.USER: 'profile', PrefixEntry.GROUP: 'slug'}
+    results = [
+        {'type': kind, 'label': item['label'],
+         'url': reverse(url_names[kind], args=[item['slug']])}
+        for kind in kinds
+        for item in prefix_index.suggest(kind, prefix)
+    ]
+    return JsonResponse({'results': results})
+
+
+def comment_paginator(post):
+    # Авторы приходят тем же запросом, а курсор (created, id) идёт
+    # по индексу comment_post_created: страница комментариев стоит
+    # одинаково и у поста с тремя комментариями, и с тысячами.
+    return CursorPaginator(
+        post.comments.select_related('author').order_by('created', 'id'),
+        settings.COMMENTS_PER_PAGE, ordering=('created', 'id'))
+
+
+def comment_page_url(username, post, comment):
+    """
+    Адрес страницы комментариев, которая заканчивается комментарием.
+
+    Курсор страницы — комментарий, стоящий на COMMENTS_PER_PAGE
+    позиций раньше; если его нет, комментарий виден на первой
+    странице.
+    """
+    paginator = comment_paginator(post)
+    url = reverse('post', args=[username, post.pk])
+    earlier = paginator.slice([comment.created, comment.pk], reverse=True)
+    start = list(earlier[paginator.per_page - 1:paginator.per_page])
+    if start:
+        url += f'?after={paginator.encode_cursor(start[0])}'
+    return f'{url}#comment_{comment.pk}'
 
 
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post.objects.select_related('author'),
-                             id=post_id, author__username=username)
-    post_count = post.author.user_posts.all().count()
-    comments = post.comments.all()
-    form = CommentForm()
-    return render(
-        request,
-        'post.html',
-        {'post': post, 'author': post.author, 'post_count': post_count,
-         'comments': comments, 'form': form}
-    )
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'author__stats'),
+        id=post_id, author__username=username)
+    # Счётчики в карточке автора меняются вместе с лентой его профиля.
+    names = [f'post:{post.pk}', f'profile:{post.author_id}']
+    feed_key = feed_cache_key(request, *names)
+
+    def build():
+        post_count = user_stats(post.author).post_count
+        comments = comment_paginator(post).get_page(
+            after=request.GET.get('after'), before=request.GET.get('before'))
+        form = CommentForm()
+        return render(
+            request,
+            'post.html',
+            {'post': post, 'author': post.author, 'post_count': post_count,
+             'comments': comments, 'form': form}
+        )
+
+    return conditional(request, feed_key, names, build)
 
 
 @login_required
+@transaction.atomic
 def new_post(request):
     if request.method != 'POST':
         form = PostForm()
         return render(request, 'new_post.html', {'form': form})
-    form = PostForm(request.POST)
+    form = PostForm(request.POST, files=request.FILES or None)
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
@@ -78,6 +169,7 @@ def new_post(request):
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, username, post_id):
     post = get_object_or_404(Post.objects.select_related('author'),
                              id=post_id, author__username=username)
@@ -101,6 +193,7 @@ def post_edit(request, username, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, username, post_id):
     post = get_object_or_404(Post, id=post_id,
                              author__username=username)
@@ -111,29 +204,30 @@ def add_comment(request, username, post_id):
         comment.author = request.user
         comment.post = post
         comment.save()
+        return redirect(comment_page_url(username, post, comment))
     return redirect('post', username=username, post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = timeline_posts(request.user).for_feed()
+    page = paginate(request, posts, 'follow_index',
+                    prefetch=thumbnails.prefetch)
     context = {'page': page, 'posts': posts}
     return render(request, 'follow.html', context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    follow_obj = Follow.objects.filter(user=request.user, author=author)
-    if request.user != author and not follow_obj.exists():
-        Follow.objects.create(user=request.user, author=author)
+    if request.user != author:
+        Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('profile', username)
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     follow_obj = get_object_or_404(
@@ -144,6 +238,26 @@ def profile_unfollow(request, username):
     return redirect('profile', username)
 
 
+@login_required
+def export(request, username, fmt):
+    """
+    Выгрузка постов и комментариев автора: export.ndjson или export.csv.
+
+    Доступна самому автору и персоналу. Ответ отдаётся потоком по мере
+    чтения из базы, поэтому память воркера не зависит от объёма.
+    """
+    author = get_object_or_404(User, username=username)
+    if request.user != author and not request.user.is_staff:
+        raise PermissionDenied
+    if fmt not in FORMATS:
+        return HttpResponseBadRequest('Формат: ndjson или csv.')
+    response = StreamingHttpResponse(export_lines(author.pk, fmt),
+                                     content_type=FORMATS[fmt])
+    response['Content-Disposition'] = (
+        f'attachment; filename="{author.username}.{fmt}"')
+    return response
+
+
 def page_not_found(request, exception):
     return render(
         request,
@@ -0,0 +1,229 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB,
+        expires REAL,
+        accessed REAL NOT NULL
+    ) WITHOUT ROWID
+    """,
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+)
+
+
+class SQLiteCache(BaseCache):
+    """
+    Общий для всех процессов хоста кэш в файле SQLite.
+
+    Воркеры gunicorn видят одни и те же записи, поэтому сброс версии
+    ленты в одном процессе сразу действует во всех. Целые числа
+    хранятся как INTEGER, и incr выполняется одним UPDATE в базе, то
+    есть атомарно между процессами. Остальные значения сериализуются
+    через pickle.
+
+    Вытеснение — LRU: у записи хранится время последнего чтения, и
+    при переполнении удаляется 1/CULL_FREQUENCY давно не читанных
+    записей. Чтобы чтения не превращались в записи, время обновляется
+    не чаще раза в LRU_RESOLUTION секунд, а размер проверяется раз
+    в CULL_EVERY записей.
+    """
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._lru_resolution = float(options.get('LRU_RESOLUTION', 5))
+        self._cull_every = int(options.get('CULL_EVERY', 100))
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def _db(self):
+        # Соединение своё у каждого потока и у каждого процесса: после
+        # fork унаследованное соединение использовать нельзя.
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            connection = sqlite3.connect(self._path, timeout=30,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            for sql in SCHEMA:
+                connection.execute(sql)
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    def _transaction(self):
+        return _Transaction(self._db)
+
+    @staticmethod
+    def _dump(value):
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _touch_stale(self, keys, now):
+        self._db.execute(
+            'UPDATE cache SET accessed = ? WHERE key IN ({}) '
+            'AND accessed < ?'.format(', '.join('?' * len(keys))),
+            [now, *keys, now - self._lru_resolution])
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        row = self._db.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?',
+            [key]).fetchone()
+        if row is None:
+            return default
+        value, expires, accessed = row
+        if expires is not None and expires <= now:
+            self._db.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?', [key, now])
+            return default
+        if accessed < now - self._lru_resolution:
+            self._touch_stale([key], now)
+        return self._load(value)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        now = time.time()
+        rows = self._db.execute(
+            'SELECT key, value, accessed FROM cache WHERE key IN ({}) '
+            'AND (expires IS NULL OR expires > ?)'.format(
+                ', '.join('?' * len(keys))),
+            [*keys, now]).fetchall()
+        stale = [key for key, _, accessed in rows
+                 if accessed < now - self._lru_resolution]
+        if stale:
+            self._touch_stale(stale, now)
+        return {keys[key]: self._load(value) for key, value, _ in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = [(self._key(key, version), self._dump(value), expires, now)
+                for key, value in data.items()]
+        with self._transaction() as db:
+            db.executemany('INSERT OR REPLACE INTO cache '
+                           '(key, value, expires, accessed) '
+                           'VALUES (?, ?, ?, ?)', rows)
+        self._count_writes(len(rows))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        with self._transaction() as db:
+            db.execute('DELETE FROM cache WHERE key = ? AND expires <= ?',
+                       [key, now])
+            added = db.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?)',
+                [key, self._dump(value), expires, now]).rowcount == 1
+        if added:
+            self._count_writes(1)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as db:
+            updated = db.execute(
+                "UPDATE cache SET value = value + ?, accessed = ? "
+                "WHERE key = ? AND typeof(value) = 'integer' "
+                "AND (expires IS NULL OR expires > ?)",
+                [delta, now, key, now]).rowcount
+            if not updated:
+                raise ValueError("Key '%s' not found" % key)
+            return db.execute('SELECT value FROM cache WHERE key = ?',
+                              [key]).fetchone()[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        return self._db.execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            [self.get_backend_timeout(timeout), now, key, now]).rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            [key, time.time()]).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            self._db.execute('DELETE FROM cache WHERE key IN ({})'.format(
+                ', '.join('?' * len(keys))), keys)
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def _count_writes(self, count):
+        self._writes += count
+        if self._writes >= self._cull_every:
+            self._writes = 0
+            self._cull()
+
+    def _cull(self):
+        with self._transaction() as db:
+            db.execute('DELETE FROM cache WHERE expires <= ?', [time.time()])
+            total = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            if total <= self._max_entries:
+                return
+            excess = total - self._max_entries
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY accessed LIMIT ?)',
+                [max(excess, total // self._cull_frequency)])
+
+    def close(self, **kwargs):
+        # Соединения живут весь срок потока: открывать файл заново
+        # на каждый запрос дороже, чем держать его.
+        pass
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT: запись сразу берёт блокировку файла."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'posts.apps.PostsConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
 ]
 
@@ -56,6 +57,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'posts.middleware.PageCacheMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -150,8 +152,102 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are streamed to a temporary file in chunks instead of being
+# buffered in memory. Images are then checked by their header
+# (IMAGE_MAX_PIXELS guards against decompression bombs) and re-encoded
+# without metadata to at most IMAGE_MAX_SIDE pixels on the long side.
+# JPEG is decoded at a reduced scale (draft), so it may be as large as
+# IMAGE_MAX_PIXELS. PNG, GIF and WebP are always decoded at full size,
+# so they are capped lower, at IMAGE_MAX_DECODED_PIXELS: an RGBA buffer
+# takes 4 bytes per pixel.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+IMAGE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_MAX_DECODED_PIXELS = 12_000_000
+IMAGE_MAX_SIDE = 2048
+IMAGE_QUALITY = 85
+
+# Thumbnail presets used by templates, pre-generated on upload by a pool
+# of THUMBNAIL_WORKERS threads (0 generates them in the calling thread).
+THUMBNAIL_PRESETS = {
+    'feed': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+
+# Every preset is also rendered at these widths and formats for
+# srcset; the last format is the <img> fallback. LQIP_WIDTH is the
+# width of the tiny inline placeholder stored on the post.
+THUMBNAIL_WIDTHS = (480, 960, 1440)
+THUMBNAIL_FORMATS = ('WEBP', 'JPEG')
+THUMBNAIL_SIZES = '(max-width: 992px) 100vw, 960px'
+LQIP_WIDTH = 16
+
+# Feeds
+
+POSTS_PER_PAGE = 10
+
+# RSS/Atom feeds list only this many of the newest posts.
+SYNDICATION_ITEMS = 20
+
+# Comments on a post page are loaded in (created, id) cursor pages.
+COMMENTS_PER_PAGE = 20
+
+# 'cursor' - keyset pagination by (pub_date, id) with ?after=/?before=
+# tokens, 'page' - classic numbered pages with COUNT(*) and OFFSET.
+FEED_PAGINATION = {
+    'index': 'cursor',
+    'group_posts': 'cursor',
+    'profile': 'cursor',
+    'follow_index': 'page',
+}
+
+# Materialized follow timelines: authors with more followers than
+# TIMELINE_FANOUT_LIMIT are merged at read time instead of fanned out.
+TIMELINE_LENGTH = 500
+TIMELINE_FANOUT_LIMIT = 1000
+
+# Rendered feed fragments are keyed by feed versions, so the timeout only
+# bounds staleness of things outside them; a fragment close to expiry is
+# re-rendered early by a single request (see posts.cache.get_or_compute).
+FEED_CACHE_TIMEOUT = 300
+
+# Whole page bodies are cached for this many seconds and shared by every
+# viewer, with per-user parts stitched in (posts.holes). Signals drop
+# them earlier by touching the feeds listed in their Surrogate-Key.
+PAGE_CACHE_TIMEOUT = 600
+
+# s-maxage for anonymous pages. Nothing purges a reverse proxy by
+# Surrogate-Key yet, so proxies must revalidate every request (a cheap
+# 304 from PageCacheMiddleware); raise this only once such a purge runs.
+PROXY_CACHE_TIMEOUT = 0
+
+# Exports stream rows read from the database in chunks of this size.
+EXPORT_CHUNK_SIZE = 2000
+
+# JSON API: default and maximum page size for ?limit=.
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# Autocomplete for users and groups: suggestions per request and how
+# long (in seconds) the answer for a prefix stays cached.
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_CACHE_TIMEOUT = 60
+
+# One SQLite file shared by every worker process of this checkout, so
+# feed invalidation and counters are consistent across workers.
+CACHE_PATH = os.environ.get('YATUBE_CACHE_PATH',
+                            os.path.join(BASE_DIR, 'cache.sqlite3'))
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.cache_backends.SQLiteCache',
+        'LOCATION': CACHE_PATH,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'CULL_FREQUENCY': 10,
+        },
     }
 }
@@ -0,0 +1,26 @@
+"""
+Django settings for test runs of the yatube project.
+
+manage.py test and pytest (see pytest.ini) both use this module.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES
+
+# A test run gets a cache file of its own: the cache.clear() calls in
+# tests must not wipe a running server's pages and locks, nor those of
+# another test run.
+_cache_dir = tempfile.mkdtemp(prefix='yatube-test-cache-')
+atexit.register(shutil.rmtree, _cache_dir, ignore_errors=True)
+CACHE_PATH = os.path.join(_cache_dir, 'cache.sqlite3')
+CACHES = {'default': {**CACHES['default'], 'LOCATION': CACHE_PATH}}
+
+# Thumbnails are made in the calling thread: a background worker could
+# write into a temporary MEDIA_ROOT after the test that created it has
+# removed it.
+THUMBNAIL_WORKERS = 0